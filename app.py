@@ -4,10 +4,20 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-import geopandas as gpd
+import diskcache
+import functools
 import gdown
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from geocoder import ZONES_URL, ZoneGeocoder, build_zone_file
+from pipeline import MAP_TIERS, SAMPLE_SEED, seeded_hash
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 server = app.server
@@ -19,29 +29,350 @@ app.title = "NYC Taxi Analytics"
 CLUSTERED_ID = "1bq9lSLqSH4AJUPLzVpu_-XnMRMpjDm6x"
 METRICS_ID   = "1L6eIJ4_KmLFVK4HEh_NtmNUNZMAn-fQI"
 MERGED_ID    = "1ellN2ccpn8Ltr_bIaV7Y5fnBrBVGrR7t"
+# trip_aggregates.parquet from `python pipeline.py aggregate`; while unset, a
+# copy placed in data_cache/ is used if there is one
+AGGREGATES_ID = None
 
 # SAMPLE SIZE LIMIT
 SAMPLE_SIZE = 200_000  # only load 200k rows
 
+# Upper bound on memory held by cached filter results (per worker)
+FILTER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Heatmap grid cell size in degrees (~200 m of latitude)
+HEATMAP_CELL_DEG = 0.002
+
+# Scatter level of detail: points sent for the whole city, doubling with
+# each zoom level past SCATTER_BASE_ZOOM up to SCATTER_MAX_POINTS
+MAP_CENTER = {'lat': 40.7580, 'lon': -73.9855}
+MAP_ZOOM = 10
+MAP_HEIGHT_PX = 420
+SCATTER_BASE_POINTS = 5000
+SCATTER_BASE_ZOOM = 11
+SCATTER_MAX_POINTS = 20000
+
+# Spatial index cell size in degrees (~550 m of latitude)
+SPATIAL_CELL_DEG = 0.005
+METERS_PER_DEG_LAT = 111_320
+
+# Feature properties kept from the trip GeoJSON; everything else is skipped
+DATETIME_COLUMNS = ["tpep_pickup_datetime", "lpep_pickup_datetime", "datetime"]
+PICKUP_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+TRIP_COLUMNS = DATETIME_COLUMNS + ["pickup_latitude", "pickup_longitude", "total_amount", "map_rank"]
+
+# In-memory trip table layout: pickup time as epoch seconds plus its day
+# (days since 1970-01-01) and hour,
+# 32-bit floats for coordinates and fares, the TLC taxi zone (LocationID,
+# 0 outside every zone), the trip's position in the seeded map sample order,
+# no geometry. Rows are sorted by
+# pickup_ts so date ranges map to contiguous row slices.
+TRIP_DTYPES = {
+    "pickup_latitude": "float32",
+    "pickup_longitude": "float32",
+    "pickup_ts": "int64",
+    "pickup_day": "uint16",
+    "pickup_hour": "uint8",
+    "total_amount": "float32",
+    "cluster": "int16",
+    "zone": "uint16",
+    "map_rank": "uint32",
+}
+SNAPSHOT_VERSION = 11  # bump whenever TRIP_DTYPES, the row order or the labelling changes
+
+# DBSCAN radius used in 04_spatial_analysis.ipynb, in EPSG:3857 metres; a
+# trip joins the cluster of the nearest clustered pickup within this distance
+CLUSTER_EPS_M = 60
+WEB_MERCATOR_RADIUS_M = 6_378_137
+
 # ================================
 # CACHE DIRECTORY
 # ================================
 CACHE_DIR = "data_cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
+# Rendered figure JSON, shared by all gunicorn workers on the box and
+# evicted oldest-first once it outgrows the size limit
+FIGURE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+figure_cache = diskcache.Cache(os.path.join(CACHE_DIR, "figures"), size_limit=FIGURE_CACHE_MAX_BYTES)
+
+# Nominatim fallback results, snapped to the same 4-decimal grid that the
+# click panel displays. Failures are remembered for a few minutes only.
+GEOCODE_PRECISION = 4
+GEOCODE_MEMORY_ENTRIES = 4096
+GEOCODE_NEGATIVE_TTL_S = 300
+# Background lookups for the click panel, which polls the cache every
+# GEOCODE_POLL_MS and gives up after GEOCODE_MAX_POLLS; a lookup still
+# running then finishes and lands in the cache for the next click
+GEOCODE_WORKERS = 4
+GEOCODE_POLL_MS = 500
+GEOCODE_MAX_POLLS = 10
+
 # ================================
 # DOWNLOAD FILES
 # ================================
-def download_cached(file_id, filename):
+def download_cached(file_id, filename, url=None):
     cached_path = os.path.join(CACHE_DIR, filename)
     if os.path.exists(cached_path):
         print(f"✓ Using cached file: {cached_path}")
         return cached_path
-    url = f"https://drive.google.com/uc?id={file_id}"
+    url = url or f"https://drive.google.com/uc?id={file_id}"
     print(f"⬇ Downloading → {cached_path}")
     gdown.download(url, cached_path, quiet=False)
     return cached_path
 
+# ================================
+# STREAMING GEOJSON READER
+# ================================
+def iter_geojson_features(path, chunk_size=1 << 20):
+    """Yield the features of a GeoJSON FeatureCollection one at a time"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buf = ""
+        start = -1
+        while start < 0:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf += chunk
+            key = buf.find('"features"')
+            if key >= 0:
+                start = buf.find("[", key)
+        pos = start + 1
+        eof = False
+
+        while True:
+            # Skip separators between features
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) and buf[pos] == "]":
+                return
+            try:
+                if pos >= len(buf):
+                    raise ValueError("buffer exhausted")
+                feature, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise ValueError(f"Truncated GeoJSON feature in {path}")
+                chunk = f.read(chunk_size)
+                eof = not chunk
+                buf = buf[pos:] + chunk
+                pos = 0
+                continue
+            yield feature
+
+def read_trip_columns(path, columns=TRIP_COLUMNS, sample_size=None, seed=SAMPLE_SEED):
+    """Read only the given feature properties into a DataFrame.
+
+    Geometry is never turned into shapely objects; coordinates come from the
+    pickup_latitude / pickup_longitude properties instead. With sample_size
+    set, a file ranked by `pipeline.py pyramid` gives its trips with
+    map_rank < sample_size, which are the start of the file, so the tiers
+    stay the pipeline's. Other files get a seeded reservoir sample in the
+    same pass. Either way memory is bounded by sample_size rather than by
+    the file size.
+    """
+    rng = random.Random(seed)
+    kept = None
+    ranked = False
+    rows = []
+    seen = 0
+    for feature in iter_geojson_features(path):
+        props = feature.get("properties") or {}
+        if kept is None:
+            kept = [col for col in columns if col in props]
+            ranked = sample_size is not None and "map_rank" in kept
+        if ranked:
+            if props["map_rank"] < sample_size:
+                rows.append(tuple(props.get(col) for col in kept))
+                if len(rows) == sample_size:
+                    break
+            continue
+        if sample_size is None or seen < sample_size:
+            rows.append(tuple(props.get(col) for col in kept))
+        else:
+            slot = rng.randrange(seen + 1)
+            if slot < sample_size:
+                rows[slot] = tuple(props.get(col) for col in kept)
+        seen += 1
+
+    if ranked:
+        print(f"✓ Read the {len(rows):,} lowest-ranked trips of the map pyramid")
+    elif sample_size is not None and seen > sample_size:
+        print(f"✓ Sampled {sample_size:,} of {seen:,} rows (seed={seed})")
+    return pd.DataFrame.from_records(rows, columns=kept or [])
+
+# ================================
+# COLUMNAR SNAPSHOT
+# ================================
+def snapshot_path_for(source_filename):
+    """Parquet snapshot of the compact trip table, keyed by sample size, seed and layout"""
+    base = os.path.splitext(source_filename)[0]
+    return os.path.join(CACHE_DIR, f"{base}.{SAMPLE_SIZE}.s{SAMPLE_SEED}.v{SNAPSHOT_VERSION}.parquet")
+
+def snapshot_is_fresh(snapshot_path, *source_paths):
+    """True if the snapshot exists and is newer than every source, all of
+    which must exist; a missing source means a step still has to run"""
+    if not os.path.exists(snapshot_path):
+        return False
+    snapshot_mtime = os.path.getmtime(snapshot_path)
+    return all(
+        os.path.exists(path) and snapshot_mtime >= os.path.getmtime(path)
+        for path in source_paths
+    )
+
+def write_snapshot(df, snapshot_path):
+    # Write to a per-process temp file and rename, so workers booting in
+    # parallel never read a half-written snapshot.
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, snapshot_path)
+        print(f"✓ Wrote snapshot: {snapshot_path}")
+    except Exception as e:
+        print("❌ Failed writing snapshot:", e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+# ================================
+# COMPACT TRIP TABLE
+# ================================
+def parse_pickup_times(values):
+    """Pickup datetimes from TLC timestamps, NaT where missing or unparseable.
+
+    Parses with the fixed PICKUP_TIME_FORMAT instead of per-element format
+    inference; only rows off that layout go through pd.to_datetime's guesser.
+    """
+    values = pd.Series(values)
+    pickup = pd.to_datetime(values, format=PICKUP_TIME_FORMAT, errors="coerce")
+    off_layout = pickup.isna() & values.notna()
+    if off_layout.any():
+        pickup[off_layout] = pd.to_datetime(values[off_layout], format="mixed", errors="coerce")
+    return pickup
+
+def map_ranks(df, pickup_ts):
+    """Dense 0..n-1 rank of every trip in the map sample order.
+
+    Follows the map_rank written by `pipeline.py pyramid` when the source
+    has one, otherwise a seeded hash of each trip, so the order never
+    depends on how the rows were read.
+    """
+    if "map_rank" in df.columns:
+        key = pd.to_numeric(df["map_rank"], errors="coerce").fillna(np.inf).to_numpy()
+    else:
+        trips = pd.DataFrame({"pickup_ts": pickup_ts}, index=df.index)
+        for col in ["pickup_latitude", "pickup_longitude"]:
+            if col in df.columns:
+                trips[col] = df[col]
+        key = seeded_hash(trips, SAMPLE_SEED)
+    ranks = np.empty(len(df), dtype=np.uint32)
+    ranks[np.argsort(key, kind="stable")] = np.arange(len(df), dtype=np.uint32)
+    return ranks
+
+def compact_trip_table(df):
+    """Convert raw trip columns into the TRIP_DTYPES layout.
+
+    Trips whose pickup time is missing or does not parse are dropped.
+    """
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            pickup = parse_pickup_times(df[col])
+            valid = pickup.notna().to_numpy()
+            if not valid.all():
+                print(f"✓ Dropped {(~valid).sum():,} trips without a pickup time")
+                df = df[valid]
+            pickup_ts = pickup[valid].astype("datetime64[s]").astype("int64").to_numpy()
+            break
+    else:
+        pickup_ts = np.full(len(df), int(pd.Timestamp("2015-01-01").timestamp()), dtype=np.int64)
+
+    columns = {
+        "pickup_ts": pickup_ts,
+        "pickup_day": pickup_ts // 86400,
+        "pickup_hour": pickup_ts // 3600 % 24,
+    }
+    for col in ["pickup_latitude", "pickup_longitude", "total_amount"]:
+        if col in df.columns:
+            columns[col] = pd.to_numeric(df[col], errors="coerce").to_numpy()
+    columns["map_rank"] = map_ranks(df, pickup_ts)
+
+    compact = pd.DataFrame(columns, index=pd.RangeIndex(len(df)))
+    for col in compact.columns:
+        compact[col] = compact[col].to_numpy().astype(TRIP_DTYPES[col])
+    compact = compact[[col for col in TRIP_DTYPES if col in compact.columns]]
+    return compact.sort_values("pickup_ts", kind="stable", ignore_index=True)
+
+def empty_trip_table():
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in TRIP_DTYPES.items()})
+
+def log_memory_footprint(df):
+    usage = df.memory_usage(index=False, deep=True)
+    print(f"\n✓ Trip table memory (pid {os.getpid()}): {usage.sum() / 1e6:.2f} MB")
+    for col, nbytes in usage.items():
+        print(f"   {col:<18} {str(df[col].dtype):<8} {nbytes / 1e6:7.2f} MB")
+
+# ================================
+# CLUSTER LABELS
+# ================================
+def assign_clusters(trips, clustered):
+    """Per-trip DBSCAN labels from the notebook's clustered sample.
+
+    A trip takes the label of the nearest clustered (non-noise) pickup within
+    CLUSTER_EPS_M, otherwise -1. Distances are taken in EPSG:3857, the
+    projection the notebook clustered in, so the radius is the same 60
+    Web Mercator metres (about 45 m on the ground in Manhattan).
+    """
+    from sklearn.neighbors import KDTree
+
+    clustered = clustered[clustered["cluster"] >= 0]
+    labels = np.full(len(trips), -1, dtype=np.int16)
+    if clustered.empty or trips.empty:
+        return labels
+
+    def to_web_mercator(df):
+        lon = np.radians(df["pickup_longitude"].to_numpy(np.float64))
+        lat = np.radians(df["pickup_latitude"].to_numpy(np.float64))
+        return np.column_stack([
+            WEB_MERCATOR_RADIUS_M * lon,
+            WEB_MERCATOR_RADIUS_M * np.log(np.tan(np.pi / 4 + lat / 2)),
+        ])
+
+    tree = KDTree(to_web_mercator(clustered))
+    dist, nearest = tree.query(to_web_mercator(trips), k=1)
+    cluster_ids = clustered["cluster"].to_numpy().astype(np.int16)
+    within = dist[:, 0] <= CLUSTER_EPS_M
+    labels[within] = cluster_ids[nearest[within, 0]]
+    return labels
+
+def load_cluster_labels(trips):
+    try:
+        clustered_path = download_cached(CLUSTERED_ID, "clustered_sample.geojson")
+        clustered = read_trip_columns(
+            clustered_path, columns=["pickup_latitude", "pickup_longitude", "cluster"]
+        )
+        labels = assign_clusters(trips, clustered)
+        print(f"✓ Labelled trips: {(labels >= 0).sum():,} of {len(labels):,} in a cluster")
+        return labels
+    except Exception as e:
+        print("❌ Failed loading cluster labels:", e)
+        return None
+
+# ================================
+# TAXI ZONES (offline reverse geocoding)
+# ================================
+def load_geocoder():
+    """Taxi zone polygons, converted to WGS84 GeoJSON once and cached"""
+    try:
+        zones_path = os.path.join(CACHE_DIR, "taxi_zones.geojson")
+        if not os.path.exists(zones_path):
+            zip_path = download_cached(None, "taxi_zones.zip", url=ZONES_URL)
+            build_zone_file(zip_path, zones_path)
+        geocoder = ZoneGeocoder(zones_path)
+        print(f"✓ Loaded {len(geocoder.zone)} taxi zones for reverse geocoding")
+        return geocoder
+    except Exception as e:
+        print("❌ Failed loading taxi zones:", e)
+        return None
+
 # ================================
 # LOAD DATA (with in-memory sampling)
 # ================================
@@ -55,62 +386,427 @@ def load_data():
         print("❌ Failed loading metrics:", e)
         metrics_df = pd.DataFrame()
 
-    # ---- LOAD MERGED GEOJSON ----
+    # ---- LOAD MERGED GEOJSON (or its columnar snapshot) ----
     try:
+        snapshot_path = snapshot_path_for("merged_sample.geojson")
+        if snapshot_is_fresh(snapshot_path,
+                             os.path.join(CACHE_DIR, "merged_sample.geojson"),
+                             os.path.join(CACHE_DIR, "clustered_sample.geojson"),
+                             os.path.join(CACHE_DIR, "taxi_zones.geojson")):
+            taxi_df = pd.read_parquet(snapshot_path)
+            print(f"✓ Loaded snapshot: {snapshot_path} ({len(taxi_df):,} rows)")
+            if not taxi_df["pickup_ts"].is_monotonic_increasing:
+                taxi_df = taxi_df.sort_values("pickup_ts", kind="stable", ignore_index=True)
+            return metrics_df, taxi_df
+
         merged_path = download_cached(MERGED_ID, "merged_sample.geojson")
         
-        # Instead of reading full file at once, use chunks to sample
-        taxi_df_full = gpd.read_file(merged_path)
-        if len(taxi_df_full) > SAMPLE_SIZE:
-            taxi_df = taxi_df_full.sample(SAMPLE_SIZE, random_state=42)
-            print(f"✓ Sampled down to {SAMPLE_SIZE:,} rows")
-        else:
-            taxi_df = taxi_df_full
-            print(f"✓ Loaded full dataset: {len(taxi_df)} rows")
-
-        # ---- Normalize Datetime Column ----
-        for col in ["tpep_pickup_datetime", "lpep_pickup_datetime", "datetime"]:
-            if col in taxi_df.columns:
-                taxi_df["pickup_datetime"] = pd.to_datetime(taxi_df[col])
-                break
+        # Stream features, keeping only the dashboard columns and a
+        # reservoir of at most SAMPLE_SIZE rows
+        taxi_df = read_trip_columns(merged_path, sample_size=SAMPLE_SIZE)
+        print(f"✓ Loaded {len(taxi_df):,} rows")
+
+        taxi_df = compact_trip_table(taxi_df)
+        labels = load_cluster_labels(taxi_df)
+        if labels is not None:
+            taxi_df["cluster"] = labels
+        if GEOCODER is not None:
+            taxi_df["zone"] = GEOCODER.location_ids(taxi_df["pickup_latitude"], taxi_df["pickup_longitude"])
+            print(f"✓ Zoned trips: {(taxi_df['zone'] > 0).sum():,} of {len(taxi_df):,} in a taxi zone")
+        # A table missing its labels or zones is served but not snapshotted,
+        # so the next boot retries the step that failed
+        if labels is not None and GEOCODER is not None:
+            write_snapshot(taxi_df, snapshot_path)
         else:
-            taxi_df["pickup_datetime"] = pd.to_datetime("2015-01-01")
+            print("⚠ Not writing snapshot: cluster labels or taxi zones are missing")
 
     except Exception as e:
         print("❌ Error loading GeoJSON:", e)
-        taxi_df = pd.DataFrame(columns=["pickup_datetime"])
+        taxi_df = empty_trip_table()
 
     return metrics_df, taxi_df
 
+# ================================
+# AGGREGATE CUBE
+# ================================
+# Hours covered by each time-of-day filter, as a boolean lookup by hour
+TIME_FILTER_HOURS = {
+    'all': list(range(24)),
+    'morning_rush': list(range(6, 10)),
+    'midday': list(range(10, 16)),
+    'evening_rush': list(range(16, 20)),
+    'night': list(range(20, 24)) + list(range(0, 6)),
+}
+HOUR_MASKS = {
+    name: np.isin(np.arange(24), hours) for name, hours in TIME_FILTER_HOURS.items()
+}
+HOUR_INDEX = {name: np.flatnonzero(mask) for name, mask in HOUR_MASKS.items()}
+# Per-cell arrays a cube can carry; duration sums only come with the aggregates
+CUBE_FIELDS = ("count", "fare_sum", "fare_count", "duration_sum", "duration_count")
+
+def build_trip_cube(df, column="cluster", offset=1):
+    """Trip counts and fare sums per (day, hour, slot).
+
+    Only days that have trips get a row, listed in the cube's days array,
+    so the gap between two loaded years costs nothing. Trips land in slot
+    column + offset. For clusters, slot 0 holds noise and unlabelled trips
+    and slot k + 1 holds cluster k; for zones (offset 0) the slot is the
+    LocationID. Without the column every trip lands in slot 0. Fare sums
+    are float32, as in cube_from_aggregates.
+    """
+    if df is None or df.empty or "pickup_day" not in df.columns:
+        return None
+
+    days, day_idx = np.unique(df["pickup_day"].to_numpy(), return_inverse=True)
+    n_days = len(days)
+    if column in df.columns:
+        slot = df[column].to_numpy().astype(np.int64) + offset
+        n_slots = int(slot.max()) + 1
+    else:
+        slot = np.zeros(len(df), dtype=np.int64)
+        n_slots = 1
+
+    shape = (n_days, 24, n_slots)
+    cell = (day_idx.astype(np.int64) * 24 + df["pickup_hour"].to_numpy()) * n_slots + slot
+    size = n_days * 24 * n_slots
+
+    count = np.bincount(cell, minlength=size).astype(np.int32).reshape(shape)
+    if "total_amount" in df.columns:
+        fare = df["total_amount"].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(fare)
+        fare_sum = np.bincount(cell[valid], weights=fare[valid], minlength=size).astype(np.float32).reshape(shape)
+        fare_count = np.bincount(cell[valid], minlength=size).astype(np.int32).reshape(shape)
+    else:
+        fare_sum = np.zeros(shape, dtype=np.float32)
+        fare_count = np.zeros(shape, dtype=np.int32)
+
+    return {
+        "days": days.astype(np.int64),
+        "count": count,
+        "fare_sum": fare_sum,
+        "fare_count": fare_count,
+    }
+
+def load_trip_aggregates():
+    """Exact per-(day, hour, zone) totals over every cleaned trip, or None"""
+    try:
+        filename = "trip_aggregates.parquet"
+        if AGGREGATES_ID:
+            path = download_cached(AGGREGATES_ID, filename)
+        else:
+            path = os.path.join(CACHE_DIR, filename)
+            if not os.path.exists(path):
+                print("✓ No trip aggregates, totals come from the sample")
+                return None
+        aggregates = pd.read_parquet(path)
+        print(f"✓ Loaded trip aggregates: {int(aggregates['trips'].sum()):,} trips "
+              f"in {len(aggregates):,} cells")
+        return aggregates
+    except Exception as e:
+        print("❌ Failed loading trip aggregates:", e)
+        return None
+
+def cube_from_aggregates(aggregates):
+    """Zone cube in build_trip_cube's layout from the aggregate table.
+
+    Sums are float32 to keep a multi-month cube small; they only feed
+    averages shown to the cent.
+    """
+    if aggregates is None or aggregates.empty:
+        return None
+
+    days, day_idx = np.unique(aggregates["day"].to_numpy(), return_inverse=True)
+    n_days = len(days)
+    n_slots = int(aggregates["zone"].max()) + 1
+    shape = (n_days, 24, n_slots)
+    cell = (day_idx.astype(np.int64) * 24 + aggregates["hour"].to_numpy()) * n_slots + aggregates["zone"].to_numpy()
+
+    cube = {"days": days.astype(np.int64)}
+    for name, column, dtype in [
+        ("count", "trips", np.int32),
+        ("fare_sum", "fare_sum", np.float32),
+        ("fare_count", "fare_count", np.int32),
+        ("duration_sum", "duration_sum", np.float32),
+        ("duration_count", "duration_count", np.int32),
+    ]:
+        values = np.zeros(n_days * 24 * n_slots, dtype=dtype)
+        values[cell] = aggregates[column].to_numpy()
+        cube[name] = values.reshape(shape)
+    return cube
+
+def cube_window(cube, start_date, end_date, time_filter, single_mode=False, fields=("count",)):
+    """Cube cells for the selected dates and time of day.
+
+    Returns the days (epoch days) and hours in the window, and for each of
+    the requested CUBE_FIELDS the cube's (days, hours, slots) cells. The
+    whole day is a view into the cube; a time filter copies only its hours.
+    """
+    lo, hi = 0, len(cube["days"])
+    if start_date:
+        start = pd.to_datetime(start_date).normalize()
+        end = pd.to_datetime(end_date).normalize() if end_date and not single_mode else start
+        start_day = int(start.timestamp()) // 86400
+        end_day = int(end.timestamp()) // 86400
+        lo, hi = np.searchsorted(cube["days"], [start_day, end_day + 1], side='left')
+        hi = max(hi, lo)
+
+    hours = HOUR_INDEX.get(time_filter, HOUR_INDEX['all'])
+    hour_cells = slice(None) if len(hours) == 24 else hours
+    window = {
+        name: cube[name][lo:hi, hour_cells]
+        for name in fields if name in cube
+    }
+    window["days"] = cube["days"][lo:hi]
+    window["hours"] = hours
+    return window
+
+def trips_per_hour(window):
+    """Trips in each of the 24 hours, zero for hours outside the window"""
+    trips = np.zeros(24, dtype=np.int64)
+    trips[window["hours"]] = window["count"].sum(axis=(0, 2))
+    return trips
+
+def cluster_centers(df):
+    """Mean pickup position of each labelled cluster in the trip table"""
+    if df is None or "cluster" not in df.columns:
+        return None
+    labelled = df["cluster"].to_numpy() >= 0
+    if not labelled.any():
+        return None
+    ids = df["cluster"].to_numpy()[labelled].astype(np.int64)
+    size = np.bincount(ids)
+    present = np.nonzero(size)[0]
+    lat_sum = np.bincount(ids, weights=df["pickup_latitude"].to_numpy(np.float64)[labelled])
+    lon_sum = np.bincount(ids, weights=df["pickup_longitude"].to_numpy(np.float64)[labelled])
+    return pd.DataFrame({
+        "cluster": present,
+        "center_lat": lat_sum[present] / size[present],
+        "center_lon": lon_sum[present] / size[present],
+    })
+
+def window_cluster_metrics(start_date, end_date, time_filter, single_mode=False):
+    """Per-cluster trips and average fare for the selected dates and hours.
+
+    The cube was bincounted by cluster at load, so this is a slice-and-sum
+    over (days x 24) cells rather than a pass over trips.
+    """
+    window = cube_window(TRIP_CUBE, start_date, end_date, time_filter, single_mode,
+                         fields=("count", "fare_sum", "fare_count"))
+    counts = window["count"].sum(axis=(0, 1))[1:]
+    fare_sum = window["fare_sum"].sum(axis=(0, 1))[1:]
+    fare_count = window["fare_count"].sum(axis=(0, 1))[1:]
+    ids = CLUSTER_CENTERS["cluster"].to_numpy()
+    table = CLUSTER_CENTERS.assign(
+        points=counts[ids],
+        avg_fare=(fare_sum[ids] / np.maximum(fare_count[ids], 1)).round(2),
+    )
+    return table[table["points"] > 0].reset_index(drop=True)
+
+def center_columns(df):
+    """Latitude and longitude column names of a cluster table, or None"""
+    lat_col = next((c for c in ['center_lat', 'lat', 'latitude', 'center_latitude'] if c in df.columns), None)
+    lon_col = next((c for c in ['center_lon', 'lon', 'longitude', 'center_longitude'] if c in df.columns), None)
+    return lat_col, lon_col
+
+def label_zones(clusters):
+    """Add the taxi zone of each cluster center as a zone column"""
+    if GEOCODER is None or clusters is None or len(clusters) == 0:
+        return clusters
+    lat_col, lon_col = center_columns(clusters)
+    if lat_col is None or lon_col is None:
+        return clusters
+    return clusters.assign(zone=GEOCODER.location_ids(clusters[lat_col], clusters[lon_col]))
+
+def zone_label(zone_id):
+    return ZONE_NAMES.get(int(zone_id), "Outside taxi zones")
+
+# ================================
+# SPATIAL INDEX
+# ================================
+
+class GridIndex:
+    """Uniform-grid index over pickup coordinates.
+
+    Row positions are sorted by grid cell, with cells numbered row by row,
+    so the cells a bbox covers in one grid row form a single contiguous span.
+    Queries return positions into the indexed frame, which combine with
+    filter_data results through rows_in_filter().
+    """
+
+    def __init__(self, df, cell_deg=SPATIAL_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.lat = df['pickup_latitude'].to_numpy(np.float64)
+        self.lon = df['pickup_longitude'].to_numpy(np.float64)
+        iy = np.floor(self.lat / cell_deg).astype(np.int64)
+        ix = np.floor(self.lon / cell_deg).astype(np.int64)
+        self.iy0, self.ix0 = int(iy.min()), int(ix.min())
+        self.ny = int(iy.max()) - self.iy0 + 1
+        self.nx = int(ix.max()) - self.ix0 + 1
+        cells = (iy - self.iy0) * self.nx + (ix - self.ix0)
+        self.order = np.argsort(cells, kind='stable')
+        self.sorted_cells = cells[self.order]
+
+    def _spans(self, bbox):
+        south, west, north, east = bbox
+        y_lo = max(int(np.floor(south / self.cell_deg)) - self.iy0, 0)
+        y_hi = min(int(np.floor(north / self.cell_deg)) - self.iy0, self.ny - 1)
+        x_lo = max(int(np.floor(west / self.cell_deg)) - self.ix0, 0)
+        x_hi = min(int(np.floor(east / self.cell_deg)) - self.ix0, self.nx - 1)
+        if y_lo > y_hi or x_lo > x_hi:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows = np.arange(y_lo, y_hi + 1) * self.nx
+        starts = np.searchsorted(self.sorted_cells, rows + x_lo, side='left')
+        ends = np.searchsorted(self.sorted_cells, rows + x_hi, side='right')
+        return starts, ends
+
+    def count_bbox(self, bbox):
+        """Upper bound on the rows inside bbox, without materializing them"""
+        starts, ends = self._spans(bbox)
+        return int((ends - starts).sum())
+
+    def bbox(self, bbox):
+        """Sorted row positions inside (south, west, north, east)"""
+        starts, ends = self._spans(bbox)
+        if len(starts) == 0:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate([self.order[a:b] for a, b in zip(starts, ends)])
+        south, west, north, east = bbox
+        lat, lon = self.lat[candidates], self.lon[candidates]
+        inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+        return np.sort(candidates[inside])
+
+    def _distances_m(self, rows, lat, lon):
+        dy = (self.lat[rows] - lat) * METERS_PER_DEG_LAT
+        dx = (self.lon[rows] - lon) * METERS_PER_DEG_LAT * np.cos(np.radians(lat))
+        return np.hypot(dx, dy)
+
+    def _radius_bbox(self, lat, lon, radius_m):
+        dlat = radius_m / METERS_PER_DEG_LAT
+        dlon = dlat / max(np.cos(np.radians(lat)), 1e-6)
+        return (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+
+    def radius(self, lat, lon, radius_m):
+        """Sorted row positions within radius_m meters of (lat, lon)"""
+        rows = self.bbox(self._radius_bbox(lat, lon, radius_m))
+        return rows[self._distances_m(rows, lat, lon) <= radius_m]
+
+    def nearest(self, lat, lon, k=1):
+        """Row positions of the k pickups closest to (lat, lon), nearest first"""
+        k = min(k, len(self.order))
+        radius_m = self.cell_deg * METERS_PER_DEG_LAT
+        # Past this radius the search circle's bbox covers every indexed point
+        max_radius_m = METERS_PER_DEG_LAT * max(
+            abs(lat - self.iy0 * self.cell_deg),
+            abs(lat - (self.iy0 + self.ny) * self.cell_deg),
+            (abs(lon - self.ix0 * self.cell_deg) + self.nx * self.cell_deg) * np.cos(np.radians(lat)),
+        )
+        while True:
+            rows = self.bbox(self._radius_bbox(lat, lon, radius_m))
+            dist = self._distances_m(rows, lat, lon)
+            # Only trust the k-th neighbour once it lies inside the search circle
+            if (len(rows) >= k and np.partition(dist, k - 1)[k - 1] <= radius_m) or radius_m >= max_radius_m:
+                nearest = np.argsort(dist, kind='stable')[:k]
+                return rows[nearest]
+            radius_m *= 2
+
+def rows_in_filter(rows, filtered):
+    """Positions within `filtered` of the taxi_df rows in `rows` that it keeps"""
+    index = filtered.index.to_numpy()
+    if len(index) == 0 or len(rows) == 0:
+        return np.empty(0, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(index, rows), len(index) - 1)
+    return pos[index[pos] == rows]
+
 # ================================
 # DATE RANGE DETECTION
 # ================================
 def detect_available_dates(df):
-    if df.empty or "pickup_datetime" not in df.columns:
+    """Month catalog of the trip table, built in one pass over pickup_day.
+
+    df is sorted by pickup_ts, so each day and each month is a contiguous
+    run of rows. Every entry carries the month's first and last day, its
+    label, its row span in df and its trips per day.
+    """
+    if df.empty or "pickup_day" not in df.columns:
         return [{'start': datetime(2015,1,1).date(),
                  'end': datetime(2015,1,31).date(),
-                 'label': 'January 2015'}]
+                 'label': 'January 2015',
+                 'rows': (0, 0),
+                 'day_counts': pd.Series(dtype="int64")}]
+
+    day = df["pickup_day"].to_numpy()
+    day_rows = np.flatnonzero(np.diff(day)) + 1
+    day_rows = np.concatenate(([0], day_rows, [len(day)]))
+    days = day[day_rows[:-1]].astype("datetime64[D]")
+    trips_per_day = np.diff(day_rows)
+
+    # Months over the (few hundred) distinct days, not over trips
+    months = days.astype("datetime64[M]")
+    month_days = np.flatnonzero(np.r_[True, months[1:] != months[:-1], True])
 
-    df["year_month"] = df["pickup_datetime"].dt.to_period("M")
     date_ranges = []
-    for period in sorted(df["year_month"].unique()):
-        subset = df[df["year_month"] == period]
+    for lo, hi in zip(month_days[:-1], month_days[1:]):
         date_ranges.append({
-            "start": subset["pickup_datetime"].min().date(),
-            "end": subset["pickup_datetime"].max().date(),
-            "label": period.strftime("%B %Y")
+            "start": pd.Timestamp(days[lo]).date(),
+            "end": pd.Timestamp(days[hi - 1]).date(),
+            "label": pd.Timestamp(months[lo]).strftime("%B %Y"),
+            "rows": (int(day_rows[lo]), int(day_rows[hi])),
+            "day_counts": pd.Series(trips_per_day[lo:hi], index=pd.DatetimeIndex(days[lo:hi])),
         })
     return date_ranges
 
 # ================================
 # INITIAL LOAD
 # ================================
+GEOCODER = load_geocoder()
+ZONE_NAMES = GEOCODER.names if GEOCODER is not None else {}
 metrics_df, taxi_df = load_data()
+log_memory_footprint(taxi_df)
 AVAILABLE_DATES = detect_available_dates(taxi_df)
+TRIP_CUBE = build_trip_cube(taxi_df)
+ZONE_CUBE = build_trip_cube(taxi_df, "zone", 0) if "zone" in taxi_df.columns else None
+# Exact totals over every trip when the aggregates are available; the map
+# and the cluster views still come from the sample
+TRIP_AGGREGATES = load_trip_aggregates()
+EXACT_CUBE = cube_from_aggregates(TRIP_AGGREGATES)
+if EXACT_CUBE is not None:
+    ZONE_CUBE = EXACT_CUBE
+TOTALS_CUBE = EXACT_CUBE if EXACT_CUBE is not None else TRIP_CUBE
+metrics_df = label_zones(metrics_df)
+CLUSTER_CENTERS = label_zones(cluster_centers(taxi_df))
+# Rows of each map tier (pipeline.MAP_TIERS) smaller than the table, in row
+# order: tier T is the trips with map_rank < T, and a view draws from the
+# smallest tier that still holds its point budget
+MAP_TIER_ROWS = []
+if "map_rank" in taxi_df.columns:
+    MAP_TIER_ROWS = [
+        np.flatnonzero(taxi_df["map_rank"].to_numpy() < tier) for tier in MAP_TIERS if tier < len(taxi_df)
+    ]
+SPATIAL_INDEX = None
+if len(taxi_df) > 0 and {'pickup_latitude', 'pickup_longitude'} <= set(taxi_df.columns):
+    SPATIAL_INDEX = GridIndex(taxi_df)
+    print(f"✓ Spatial index: {SPATIAL_INDEX.ny} x {SPATIAL_INDEX.nx} grid over {len(taxi_df):,} pickups")
+for cube_name, cube in [("Aggregate cube", TRIP_CUBE), ("Exact totals cube", EXACT_CUBE)]:
+    if cube is not None:
+        cube_bytes = sum(cube[name].nbytes for name in CUBE_FIELDS if name in cube)
+        print(f"✓ {cube_name}: {cube['count'].shape} cells, {cube_bytes / 1e6:.2f} MB")
 
 data_min_date = AVAILABLE_DATES[0]['start']
 data_max_date = AVAILABLE_DATES[-1]['end']
 
+def data_version(*frames):
+    """Digest of the loaded data and of this file, so cached figures from
+    another dataset or an older deploy are never served"""
+    digest = hashlib.blake2b(digest_size=8)
+    with open(__file__, "rb") as f:
+        digest.update(f.read())
+    for df in frames:
+        if df is not None and len(df) > 0:
+            digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+DATA_VERSION = data_version(taxi_df, metrics_df, TRIP_AGGREGATES)
+
 print("\n✓ Available Date Ranges:")
 for r in AVAILABLE_DATES:
     print(f" → {r['label']} ({r['start']} → {r['end']})")
@@ -605,6 +1301,12 @@ app.layout = html.Div([
                         dcc.Graph(id='cluster-chart', config={'displayModeBar': False}, style={'height': '280px'}),
                         type='circle', color='#f59e0b'
                     )
+                ], className='glass-card', style={'marginBottom': '20px'}),
+                
+                # Zone Chart
+                html.Div([
+                    html.Div("Top Zones", style={'fontSize': '0.75rem', 'fontWeight': '600', 'color': '#94a3b8', 'marginBottom': '12px', 'textTransform': 'uppercase', 'letterSpacing': '0.05em'}),
+                    dcc.Graph(id='zone-chart', config={'displayModeBar': False}, style={'height': '280px'})
                 ], className='glass-card')
                 
             ], style={'flex': '1', 'minWidth': '0'})
@@ -619,31 +1321,222 @@ app.layout = html.Div([
 # ============================================
 
 def filter_data(df, start_date, end_date, time_filter, single_mode=False):
-    if df is None or 'pickup_datetime' not in df.columns:
+    """Trips in the selected dates and time of day.
+
+    df must be sorted by pickup_ts: the date range is turned into a row slice
+    with a binary search on pickup_day, and only the time-of-day window needs
+    a mask.
+    """
+    if df is None or 'pickup_day' not in df.columns:
         return df
     
-    filtered = df.copy()
+    filtered = df
     
     if start_date:
-        start = pd.to_datetime(start_date).date()
-        end = pd.to_datetime(end_date).date() if end_date and not single_mode else start
+        start = pd.to_datetime(start_date).normalize()
+        end = pd.to_datetime(end_date).normalize() if end_date and not single_mode else start
+        start_day = int(start.timestamp()) // 86400
+        end_day = int(end.timestamp()) // 86400
         
-        mask = (filtered['pickup_datetime'].dt.date >= start) & (filtered['pickup_datetime'].dt.date <= end)
-        filtered = filtered[mask]
+        lo, hi = np.searchsorted(df['pickup_day'].to_numpy(), [start_day, end_day + 1], side='left')
+        filtered = df.iloc[lo:hi]
     
-    if time_filter != 'all' and len(filtered) > 0:
-        hour = filtered['pickup_datetime'].dt.hour
-        if time_filter == 'morning_rush':
-            filtered = filtered[(hour >= 6) & (hour < 10)]
-        elif time_filter == 'midday':
-            filtered = filtered[(hour >= 10) & (hour < 16)]
-        elif time_filter == 'evening_rush':
-            filtered = filtered[(hour >= 16) & (hour < 20)]
-        elif time_filter == 'night':
-            filtered = filtered[(hour >= 20) | (hour < 6)]
+    if time_filter in HOUR_MASKS and time_filter != 'all' and len(filtered) > 0:
+        filtered = filtered[HOUR_MASKS[time_filter][filtered['pickup_hour'].to_numpy()]]
     
     return filtered
 
+class FilterCache:
+    """Bounded LRU of filter_data results with hit/miss counters.
+
+    The stats, map and chart callbacks all fire for the same inputs; the first
+    one computes the filter and the others wait on its future instead of
+    repeating it. Filters for different keys compute in parallel, outside
+    the lock.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self.pending[key] = future
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = compute()
+        except Exception as e:
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+
+        size = int(result.memory_usage(index=False).sum()) if result is not None else 0
+        with self.lock:
+            del self.pending[key]
+            if size <= self.max_bytes:
+                self.entries[key] = (result, size)
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    _, (_, evicted_size) = self.entries.popitem(last=False)
+                    self.nbytes -= evicted_size
+            print(f"🔎 Filter cache: {self.hits} hits, {self.misses} misses, "
+                  f"{len(self.entries)} entries, {self.nbytes / 1e6:.1f} MB")
+        future.set_result(result)
+        return result
+
+FILTER_CACHE = FilterCache(FILTER_CACHE_MAX_BYTES)
+
+def filter_key(start_date, end_date, time_filter, single_mode=False):
+    """Normalized filter inputs: ISO dates, no end date in single-day mode"""
+    start = str(pd.to_datetime(start_date).date()) if start_date else None
+    end = str(pd.to_datetime(end_date).date()) if end_date and not single_mode else None
+    return (start, end, time_filter, bool(single_mode))
+
+def cached_filter(start_date, end_date, time_filter, single_mode=False):
+    """filter_data over taxi_df, shared across callbacks through FILTER_CACHE"""
+    return FILTER_CACHE.get(
+        filter_key(start_date, end_date, time_filter, single_mode),
+        lambda: filter_data(taxi_df, start_date, end_date, time_filter, single_mode)
+    )
+
+class Uncached:
+    """Wraps a callback result that cached_figure returns but never stores,
+    such as the fallback figure of a failed render"""
+
+    def __init__(self, value):
+        self.value = value
+
+def cached_figure(name, key_func):
+    """Serve a figure-building function from figure_cache.
+
+    The key is (name, DATA_VERSION, key_func(*args)); hits come back as the
+    stored figure dict, which Dash serializes without rebuilding the figure.
+    Results wrapped in Uncached are unwrapped and left out of the cache.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = f"{name}:{DATA_VERSION}:{json.dumps(key_func(*args), default=str)}"
+            cached = figure_cache.get(key)
+            if cached is not None:
+                return json.loads(cached)
+            fig = func(*args)
+            if isinstance(fig, Uncached):
+                return fig.value
+            if isinstance(fig, go.Figure):
+                figure_cache.set(key, fig.to_json())
+            return fig
+        return wrapper
+    return decorator
+
+def chart_key(start, end, time_filter, single_class):
+    return filter_key(start, end, time_filter, 'active' in (single_class or ''))
+
+def map_key(start, end, time_filter, map_type, single_mode, viewport):
+    view = None
+    if viewport is not None:
+        view = ([round(v, 4) for v in viewport['bbox']], round(viewport['zoom'], 2))
+    return filter_key(start, end, time_filter, single_mode) + (map_type, view)
+
+def density_grid(df, cell_deg=HEATMAP_CELL_DEG):
+    """Pickup counts per fixed grid cell, as (center lats, center lons, counts).
+
+    Cells are anchored at 0°, so the same trips always bin the same way.
+    """
+    iy = np.floor(df['pickup_latitude'].to_numpy(np.float64) / cell_deg).astype(np.int64)
+    ix = np.floor(df['pickup_longitude'].to_numpy(np.float64) / cell_deg).astype(np.int64)
+    iy0, ix0 = iy.min(), ix.min()
+    width = ix.max() - ix0 + 1
+    cells, counts = np.unique((iy - iy0) * width + (ix - ix0), return_counts=True)
+    lat = (cells // width + iy0 + 0.5) * cell_deg
+    lon = (cells % width + ix0 + 0.5) * cell_deg
+    return lat, lon, counts
+
+def parse_viewport(relayout_data):
+    """Center, zoom and (south, west, north, east) bbox of main-map's view.
+
+    Returns None until the user has moved the map.
+    """
+    if not relayout_data or 'mapbox.zoom' not in relayout_data:
+        return None
+    zoom = relayout_data['mapbox.zoom']
+    center = relayout_data.get('mapbox.center') or MAP_CENTER
+    corners = (relayout_data.get('mapbox._derived') or {}).get('coordinates')
+    if corners:
+        lons = [c[0] for c in corners]
+        lats = [c[1] for c in corners]
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+    else:
+        # No corner coordinates: estimate from zoom, assuming a 2.5:1 map.
+        # A pixel spans a fixed number of degrees of longitude, and cos(lat)
+        # times that in latitude.
+        deg_per_px = 360 / (512 * 2 ** zoom)
+        half_lon = MAP_HEIGHT_PX * 2.5 / 2 * deg_per_px
+        half_lat = MAP_HEIGHT_PX / 2 * deg_per_px * np.cos(np.radians(center['lat']))
+        bbox = (center['lat'] - half_lat, center['lon'] - half_lon,
+                center['lat'] + half_lat, center['lon'] + half_lon)
+    return {'center': center, 'zoom': zoom, 'bbox': bbox}
+
+def scatter_point_budget(zoom):
+    extra_levels = max((zoom or MAP_ZOOM) - SCATTER_BASE_ZOOM, 0)
+    return int(min(SCATTER_BASE_POINTS * 2 ** extra_levels, SCATTER_MAX_POINTS))
+
+def in_bbox(df, bbox):
+    south, west, north, east = bbox
+    lat = df['pickup_latitude'].to_numpy()
+    lon = df['pickup_longitude'].to_numpy()
+    return df[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)]
+
+def points_in_view(filtered, bbox):
+    """Rows of a filter_data result inside bbox.
+
+    Uses the spatial index when the view holds fewer trips than the filter
+    result, otherwise scans the filtered coordinates directly.
+    """
+    if SPATIAL_INDEX is not None and SPATIAL_INDEX.count_bbox(bbox) < len(filtered):
+        return filtered.iloc[rows_in_filter(SPATIAL_INDEX.bbox(bbox), filtered)]
+    return in_bbox(filtered, bbox)
+
+def scatter_points(filtered, bbox, budget):
+    """At most budget trips of a filter_data result inside bbox (None: the
+    whole city), drawn from the smallest map tier that holds enough of them.
+
+    Falls back to every trip in view when no tier is big enough. Within the
+    tier the lowest map_rank wins, so the same inputs always give the same
+    points and a bigger budget only adds to them.
+    """
+    for tier_rows in MAP_TIER_ROWS:
+        points = filtered.iloc[rows_in_filter(tier_rows, filtered)]
+        if bbox is not None:
+            points = in_bbox(points, bbox)
+        if len(points) >= budget:
+            break
+    else:
+        points = points_in_view(filtered, bbox) if bbox is not None else filtered
+    if len(points) > budget and 'map_rank' in points.columns:
+        points = points.iloc[np.sort(np.argpartition(points['map_rank'].to_numpy(), budget - 1)[:budget])]
+    return points
+
 def get_count_column(df):
     """Find the count column in metrics dataframe"""
     if df is None:
@@ -654,7 +1547,116 @@ def get_count_column(df):
     num_cols = df.select_dtypes(include=[np.number]).columns
     return num_cols[0] if len(num_cols) > 0 else None
 
+class LocationCache:
+    """Reverse geocodes keyed by coordinates snapped to a precision grid.
+
+    An in-process LRU sits in front of a diskcache store that all workers
+    share and that survives restarts. Failed lookups (None) are cached too,
+    but expire after negative_ttl_s so they get retried.
+    """
+
+    def __init__(self, directory, precision, max_entries, negative_ttl_s):
+        self.store = diskcache.Cache(directory)
+        self.precision = precision
+        self.max_entries = max_entries
+        self.negative_ttl_s = negative_ttl_s
+        self.entries = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def snap(self, lat, lon):
+        return round(float(lat), self.precision), round(float(lon), self.precision)
+
+    def _remember(self, key, name, expires_at):
+        with self.lock:
+            self.entries[key] = (name, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def _cached(self, key):
+        """(True, name) for a live memory or disk entry, else (False, None)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.time()):
+                self.entries.move_to_end(key)
+                self.memory_hits += 1
+                return True, entry[0]
+
+        missing = object()
+        name, expires_at = self.store.get(key, default=missing, expire_time=True)
+        if name is not missing:
+            self.disk_hits += 1
+            self._remember(key, name, expires_at)
+            return True, name
+        return False, None
+
+    def peek(self, lat, lon):
+        """Cached name for the point without resolving it, as (found, name)"""
+        lat, lon = self.snap(lat, lon)
+        return self._cached(f"{lat:.{self.precision}f},{lon:.{self.precision}f}")
+
+    def get(self, lat, lon, resolve):
+        lat, lon = self.snap(lat, lon)
+        key = f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+        found, name = self._cached(key)
+        if found:
+            return name
+
+        # The network call runs outside the lock so other lookups are not held up
+        self.misses += 1
+        name = resolve(lat, lon)
+        expire = self.negative_ttl_s if name is None else None
+        self.store.set(key, name, expire=expire)
+        self._remember(key, name, time.time() + expire if expire else None)
+        print(f"📍 Geocode cache: {self.memory_hits} memory hits, {self.disk_hits} disk hits, "
+              f"{self.misses} misses")
+        return name
+
+LOCATION_CACHE = LocationCache(
+    os.path.join(CACHE_DIR, "geocode"), GEOCODE_PRECISION,
+    GEOCODE_MEMORY_ENTRIES, GEOCODE_NEGATIVE_TTL_S
+)
+
+def zone_location_name(lat, lon):
+    """Taxi zone and borough of the point from the local lookup, or None"""
+    if GEOCODER is None:
+        return None
+    match = GEOCODER.lookup(lat, lon)
+    if match is None:
+        return None
+    zone, borough = match
+    return f"{zone}, {borough}"
+
 def get_location_name(lat, lon):
+    """Get location name from coordinates: the local taxi zone lookup,
+    falling back to Nominatim for points outside every zone"""
+    return zone_location_name(lat, lon) or LOCATION_CACHE.get(lat, lon, nominatim_location_name)
+
+geocode_pool = ThreadPoolExecutor(max_workers=GEOCODE_WORKERS, thread_name_prefix="geocode")
+pending_lookups = {}
+pending_lock = threading.RLock()
+
+def lookup_location_async(lat, lon):
+    """Future for get_location_name; clicks on the same snapped coordinates
+    while a lookup is in flight share that lookup"""
+    key = LOCATION_CACHE.snap(lat, lon)
+    with pending_lock:
+        future = pending_lookups.get(key)
+        if future is None:
+            future = geocode_pool.submit(get_location_name, *key)
+            pending_lookups[key] = future
+
+            def done(finished):
+                with pending_lock:
+                    if pending_lookups.get(key) is finished:
+                        del pending_lookups[key]
+            future.add_done_callback(done)
+    return future
+
+def nominatim_location_name(lat, lon):
     """Get location name from coordinates using Nominatim"""
     try:
         from urllib.request import urlopen, Request
@@ -695,7 +1697,8 @@ def update_trip_count(_):
     if taxi_df is not None:
         months = len(AVAILABLE_DATES)
         month_text = "month" if months == 1 else "months"
-        return f"{len(taxi_df):,} trips • {months} {month_text}"
+        trips = int(TRIP_AGGREGATES['trips'].sum()) if TRIP_AGGREGATES is not None else len(taxi_df)
+        return f"{trips:,} trips • {months} {month_text}"
     return f"{SAMPLE_SIZE:,} trips"
 
 @app.callback(
@@ -817,13 +1820,16 @@ def update_all_date_controls(month_idx, single_clicks, range_clicks, current_sta
 )
 def update_stats(start, end, time_filter, single_class):
     single_mode = 'active' in (single_class or '')
-    filtered = filter_data(taxi_df, start, end, time_filter, single_mode)
+    if TOTALS_CUBE is None:
+        return "0", str(len(metrics_df)) if metrics_df is not None else "—", "—"
+    window = cube_window(TOTALS_CUBE, start, end, time_filter, single_mode,
+                         fields=("count", "fare_sum", "fare_count"))
+    trip_count = int(window['count'].sum())
     
-    if filtered is None or len(filtered) == 0:
+    if trip_count == 0:
         return "0", str(len(metrics_df)) if metrics_df is not None else "—", "—"
     
     # Format numbers to fit in stat boxes - handle both small and large numbers
-    trip_count = len(filtered)
     if trip_count >= 1000000:
         trips = f"{trip_count/1000000:.1f}M"
     elif trip_count >= 10000:
@@ -837,8 +1843,9 @@ def update_stats(start, end, time_filter, single_class):
     clusters = str(len(metrics_df)) if metrics_df is not None else "—"
     
     # Average fare - show with dollar sign and 2 decimals
-    if 'total_amount' in filtered.columns:
-        avg_fare = filtered['total_amount'].mean()
+    fare_count = int(window['fare_count'].sum())
+    if fare_count > 0:
+        avg_fare = window['fare_sum'].sum() / fare_count
         avg_fare_str = f"${avg_fare:.2f}"
     else:
         avg_fare_str = "—"
@@ -875,11 +1882,28 @@ def update_map_info(map_type):
     Output('main-map', 'figure'),
     [Input('start-date', 'date'), Input('end-date', 'date'), 
      Input('time-filter', 'value'), Input('map-type', 'value'),
-     Input('mode-single', 'className')]
+     Input('mode-single', 'className'), Input('main-map', 'relayoutData')]
 )
-def update_map(start, end, time_filter, map_type, single_class):
+def update_map(start, end, time_filter, map_type, single_class, relayout_data):
+    viewport = parse_viewport(relayout_data)
+    ctx = callback_context
+    if ctx.triggered and ctx.triggered[0]['prop_id'] == 'main-map.relayoutData':
+        # Only the scatter view depends on what is on screen
+        if map_type != 'scatter' or viewport is None:
+            return dash.no_update
+    
     single_mode = 'active' in (single_class or '')
-    filtered = filter_data(taxi_df, start, end, time_filter, single_mode)
+    if map_type == 'clusters':
+        if CLUSTER_CENTERS is None:
+            return CLUSTER_MAP_FIGURE
+        return render_cluster_map(start, end, time_filter, single_mode)
+    
+    return render_map(start, end, time_filter, map_type, single_mode,
+                      viewport if map_type == 'scatter' else None)
+
+@cached_figure('map', map_key)
+def render_map(start, end, time_filter, map_type, single_mode, viewport):
+    filtered = cached_filter(start, end, time_filter, single_mode)
     
     if filtered is None or len(filtered) == 0:
         fig = go.Figure()
@@ -901,11 +1925,7 @@ def update_map(start, end, time_filter, map_type, single_class):
         )
         return fig
     
-    if map_type in ['scatter', 'heatmap'] and len(filtered) > 5000:
-        display_df = filtered.sample(5000)
-        print(f"📍 Displaying 5,000 sample points from {len(filtered):,} total trips")
-    else:
-        display_df = filtered
+    display_df = filtered
     
     if 'pickup_latitude' not in display_df.columns or 'pickup_longitude' not in display_df.columns:
         fig = go.Figure()
@@ -926,84 +1946,104 @@ def update_map(start, end, time_filter, map_type, single_class):
         return fig
     
     if map_type == 'scatter':
+        # Only send points inside the current view, thinned to a budget
+        # that grows with zoom; small enough views show every trip
+        budget = scatter_point_budget(viewport['zoom'] if viewport else None)
+        display_df = scatter_points(filtered, viewport['bbox'] if viewport else None, budget)
+        if len(display_df) < len(filtered):
+            print(f"📍 Displaying {len(display_df):,} sample points from {len(filtered):,} total trips")
+        
         fig = px.scatter_mapbox(
             display_df,
             lat='pickup_latitude',
             lon='pickup_longitude',
             hover_data={'pickup_latitude': ':.4f', 'pickup_longitude': ':.4f'},
-            zoom=10,
-            height=420
+            zoom=MAP_ZOOM,
+            height=MAP_HEIGHT_PX
         )
         fig.update_traces(marker=dict(size=5, color='#3b82f6', opacity=0.6))
     
     elif map_type == 'heatmap':
-        fig = px.density_mapbox(
-            display_df,
-            lat='pickup_latitude',
-            lon='pickup_longitude',
+        # Bin every filtered trip server-side; the payload grows with the
+        # number of occupied cells, not the number of trips
+        cell_lat, cell_lon, cell_counts = density_grid(display_df)
+        fig = go.Figure(go.Densitymapbox(
+            lat=cell_lat,
+            lon=cell_lon,
+            z=cell_counts,
             radius=10,
-            zoom=10,
-            height=420,
-            color_continuous_scale='Turbo'
-        )
+            colorscale='Turbo',
+            hovertemplate='%{z:,} pickups<extra></extra>'
+        ))
+        fig.update_layout(height=MAP_HEIGHT_PX)
     
-    else:
-        if metrics_df is not None and len(metrics_df) > 0:
-            lat_col = None
-            lon_col = None
-            
-            for lat_name in ['center_lat', 'lat', 'latitude', 'center_latitude']:
-                if lat_name in metrics_df.columns:
-                    lat_col = lat_name
-                    break
-            
-            for lon_name in ['center_lon', 'lon', 'longitude', 'center_longitude']:
-                if lon_name in metrics_df.columns:
-                    lon_col = lon_name
-                    break
-            
-            if lat_col and lon_col:
-                count_col = get_count_column(metrics_df)
-                fig = px.scatter_mapbox(
-                    metrics_df,
-                    lat=lat_col,
-                    lon=lon_col,
-                    size=count_col if count_col else None,
-                    color=count_col if count_col else None,
-                    hover_data={count_col: True} if count_col else {},
-                    zoom=10,
-                    height=420,
-                    color_continuous_scale='Viridis'
-                )
-            else:
-                fig = go.Figure()
-                fig.add_annotation(
-                    text='Cluster location data not available',
-                    xref='paper', yref='paper',
-                    x=0.5, y=0.5,
-                    showarrow=False,
-                    font={'size': 16, 'color': '#64748b'}
-                )
+    return style_map(fig, viewport)
+
+def style_map(fig, viewport=None):
+    fig.update_layout(
+        mapbox_style='open-street-map',
+        mapbox=dict(
+            center=viewport['center'] if viewport else MAP_CENTER,
+            zoom=viewport['zoom'] if viewport else MAP_ZOOM
+        ),
+        uirevision='main-map',
+        margin=dict(l=0, r=0, t=0, b=0),
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        showlegend=False
+    )
+    return fig
+
+def build_cluster_map(metrics_df):
+    """Cluster layer for the map; it depends only on metrics_df"""
+    if metrics_df is not None and len(metrics_df) > 0:
+        lat_col, lon_col = center_columns(metrics_df)
+        
+        if lat_col and lon_col:
+            count_col = get_count_column(metrics_df)
+            if 'zone' in metrics_df.columns:
+                metrics_df = metrics_df.assign(neighborhood=metrics_df['zone'].map(zone_label))
+            fig = px.scatter_mapbox(
+                metrics_df,
+                lat=lat_col,
+                lon=lon_col,
+                hover_name='neighborhood' if 'neighborhood' in metrics_df.columns else None,
+                size=count_col if count_col else None,
+                color=count_col if count_col else None,
+                hover_data={count_col: True} if count_col else {},
+                zoom=MAP_ZOOM,
+                height=MAP_HEIGHT_PX,
+                color_continuous_scale='Viridis'
+            )
         else:
             fig = go.Figure()
             fig.add_annotation(
-                text='Cluster data not available',
+                text='Cluster location data not available',
                 xref='paper', yref='paper',
                 x=0.5, y=0.5,
                 showarrow=False,
                 font={'size': 16, 'color': '#64748b'}
             )
+    else:
+        fig = go.Figure()
+        fig.add_annotation(
+            text='Cluster data not available',
+            xref='paper', yref='paper',
+            x=0.5, y=0.5,
+            showarrow=False,
+            font={'size': 16, 'color': '#64748b'}
+        )
     
-    fig.update_layout(
-        mapbox_style='open-street-map',
-        mapbox=dict(center=dict(lat=40.7580, lon=-73.9855)),
-        margin=dict(l=0, r=0, t=0, b=0),
-        paper_bgcolor='rgba(0,0,0,0)',
-        plot_bgcolor='rgba(0,0,0,0)',
-        showlegend=False
-    )
-    
-    return fig
+    return style_map(fig)
+
+# Fallback when trips carry no cluster labels: the static metrics.csv
+# layer, built once per worker and served as a plain dict
+CLUSTER_MAP_FIGURE = json.loads(build_cluster_map(metrics_df).to_json())
+
+@cached_figure('cluster-map', filter_key)
+def render_cluster_map(start, end, time_filter, single_mode):
+    """Cluster layer sized by trips in the selected window, read off the cube"""
+    return build_cluster_map(window_cluster_metrics(start, end, time_filter, single_mode))
 
 @app.callback(
     Output('location-info', 'children'),
@@ -1019,16 +2059,17 @@ def display_click_info(click_data):
         lon = point.get('lon')
         
         if lat and lon:
-            location_name = get_location_name(lat, lon)
-            
+            # Coordinates render now; the name is filled in by fill_location_name
             return html.Div([
                 html.Div([
                     html.Span("📍 Selected Location", style={'fontWeight': '600', 'fontSize': '0.85rem', 'color': '#f8fafc'}),
                 ], style={'marginBottom': '8px'}),
                 
-                html.Div([
-                    html.Span(f"{location_name}", style={'color': '#e2e8f0', 'fontSize': '0.9rem', 'fontWeight': '500', 'display': 'block', 'marginBottom': '6px'}),
-                ], style={'marginBottom': '6px'}) if location_name else None,
+                html.Div(
+                    html.Span("Looking up neighborhood…", style={'color': '#64748b', 'fontSize': '0.8rem'}),
+                    id='location-name', style={'marginBottom': '6px'}
+                ),
+                dcc.Interval(id='location-poll', interval=GEOCODE_POLL_MS, max_intervals=GEOCODE_MAX_POLLS),
                 
                 html.Div([
                     html.Span(f"Coordinates: ", style={'color': '#94a3b8', 'fontSize': '0.8rem'}),
@@ -1047,17 +2088,49 @@ def display_click_info(click_data):
     
     return None
 
+@app.callback(
+    [Output('location-name', 'children'), Output('location-poll', 'disabled')],
+    [Input('location-name', 'id'), Input('location-poll', 'n_intervals')],
+    State('main-map', 'clickData')
+)
+def fill_location_name(_, n_intervals, click_data):
+    """Name the clicked point without holding the request thread.
+
+    Taxi zones resolve on the spot. Otherwise the Nominatim fallback runs on
+    geocode_pool and the panel's location-poll interval checks the cache
+    until the name lands or GEOCODE_MAX_POLLS runs out.
+    """
+    try:
+        point = click_data['points'][0]
+        lat, lon = point['lat'], point['lon']
+        location_name = zone_location_name(lat, lon)
+        if location_name is None:
+            found, location_name = LOCATION_CACHE.peek(lat, lon)
+            if not found:
+                lookup_location_async(lat, lon)
+                if (n_intervals or 0) < GEOCODE_MAX_POLLS:
+                    return dash.no_update, False
+                print("Location lookup timed out")
+    except Exception as e:
+        print(f"Error in location lookup: {e}")
+        location_name = None
+    
+    if not location_name:
+        return None, True
+    return html.Span(f"{location_name}", style={'color': '#e2e8f0', 'fontSize': '0.9rem', 'fontWeight': '500', 'display': 'block', 'marginBottom': '6px'}), True
+
 @app.callback(
     Output('time-chart', 'figure'),
     [Input('start-date', 'date'), Input('end-date', 'date'),
      Input('time-filter', 'value'), Input('mode-single', 'className')]
 )
+@cached_figure('time-chart', chart_key)
 def update_time_chart(start, end, time_filter, single_class):
     try:
         single_mode = 'active' in (single_class or '')
-        filtered = filter_data(taxi_df, start, end, time_filter, single_mode)
+        window = cube_window(TOTALS_CUBE, start, end, time_filter, single_mode) if TOTALS_CUBE is not None else None
         
-        if filtered is None or len(filtered) == 0:
+        if window is None or window['count'].sum() == 0:
             fig = go.Figure()
             fig.add_annotation(
                 text='No data for selected date range',
@@ -1078,11 +2151,7 @@ def update_time_chart(start, end, time_filter, single_class):
             return fig
         
         if single_mode:
-            hourly = filtered.groupby(filtered['pickup_datetime'].dt.hour).size().reset_index()
-            hourly.columns = ['hour', 'trips']
-            
-            all_hours = pd.DataFrame({'hour': range(24)})
-            hourly = all_hours.merge(hourly, on='hour', how='left').fillna(0)
+            hourly = pd.DataFrame({'hour': range(24), 'trips': trips_per_hour(window)})
             
             fig = go.Figure()
             fig.add_trace(go.Bar(
@@ -1113,8 +2182,11 @@ def update_time_chart(start, end, time_filter, single_class):
                 bargap=0.15
             )
         else:
-            daily = filtered.groupby(filtered['pickup_datetime'].dt.date).size().reset_index()
-            daily.columns = ['date', 'trips']
+            trips_per_day = window['count'].sum(axis=(1, 2))
+            daily = pd.DataFrame({
+                'date': pd.to_datetime(window['days'] * 86400, unit='s').date,
+                'trips': trips_per_day
+            })
             
             fig = go.Figure()
             fig.add_trace(go.Scatter(
@@ -1166,19 +2238,20 @@ def update_time_chart(start, end, time_filter, single_class):
             plot_bgcolor='rgba(0,0,0,0)',
             height=200
         )
-        return fig
+        return Uncached(fig)
 
 @app.callback(
     Output('hourly-chart', 'figure'),
     [Input('start-date', 'date'), Input('end-date', 'date'),
      Input('time-filter', 'value'), Input('mode-single', 'className')]
 )
+@cached_figure('hourly-chart', chart_key)
 def update_hourly_chart(start, end, time_filter, single_class):
     try:
         single_mode = 'active' in (single_class or '')
-        filtered = filter_data(taxi_df, start, end, time_filter, single_mode)
+        window = cube_window(TOTALS_CUBE, start, end, time_filter, single_mode) if TOTALS_CUBE is not None else None
         
-        if filtered is None or len(filtered) == 0:
+        if window is None or window['count'].sum() == 0:
             fig = go.Figure()
             fig.add_annotation(
                 text='No data for selected date range',
@@ -1198,11 +2271,7 @@ def update_hourly_chart(start, end, time_filter, single_class):
             )
             return fig
         
-        hourly = filtered.groupby(filtered['pickup_datetime'].dt.hour).size().reset_index()
-        hourly.columns = ['hour', 'trips']
-        
-        all_hours = pd.DataFrame({'hour': range(24)})
-        hourly = all_hours.merge(hourly, on='hour', how='left').fillna(0)
+        hourly = pd.DataFrame({'hour': range(24), 'trips': trips_per_hour(window)})
         
         fig = go.Figure()
         fig.add_trace(go.Bar(
@@ -1260,15 +2329,22 @@ def update_hourly_chart(start, end, time_filter, single_class):
             plot_bgcolor='rgba(0,0,0,0)',
             height=200
         )
-        return fig
+        return Uncached(fig)
 
 @app.callback(
     Output('cluster-chart', 'figure'),
-    Input('cluster-chart', 'id')
+    [Input('start-date', 'date'), Input('end-date', 'date'),
+     Input('time-filter', 'value'), Input('mode-single', 'className')]
 )
-def update_cluster_chart(_):
+@cached_figure('cluster-chart', chart_key)
+def update_cluster_chart(start, end, time_filter, single_class):
     try:
-        if metrics_df is None or len(metrics_df) == 0:
+        clusters_df = metrics_df
+        if CLUSTER_CENTERS is not None:
+            single_mode = 'active' in (single_class or '')
+            clusters_df = window_cluster_metrics(start, end, time_filter, single_mode)
+        
+        if clusters_df is None or len(clusters_df) == 0:
             fig = go.Figure()
             fig.update_layout(
                 template='plotly_dark',
@@ -1289,7 +2365,7 @@ def update_cluster_chart(_):
             )
             return fig
         
-        count_col = get_count_column(metrics_df)
+        count_col = get_count_column(clusters_df)
         
         if count_col is None:
             fig = go.Figure()
@@ -1312,7 +2388,7 @@ def update_cluster_chart(_):
             )
             return fig
         
-        top_clusters = metrics_df.nlargest(12, count_col).copy()
+        top_clusters = clusters_df.nlargest(12, count_col).copy()
         top_clusters = top_clusters.sort_values(count_col, ascending=True)
         
         if 'cluster_id' in top_clusters.columns:
@@ -1323,6 +2399,10 @@ def update_cluster_chart(_):
             cluster_ids = top_clusters.reset_index()['index'].astype(str)
         
         top_clusters['label'] = 'Cluster ' + cluster_ids
+        if 'zone' in top_clusters.columns:
+            top_clusters['neighborhood'] = top_clusters['zone'].map(zone_label)
+        else:
+            top_clusters['neighborhood'] = ''
         
         colors = ['#f59e0b', '#f97316', '#ef4444', '#ec4899', '#d946ef', '#c026d3', 
                   '#a855f7', '#9333ea', '#7c3aed', '#6366f1', '#3b82f6', '#0ea5e9']
@@ -1339,7 +2419,8 @@ def update_cluster_chart(_):
             text=top_clusters[count_col],
             texttemplate='%{text:,}',
             textposition='outside',
-            hovertemplate='<b>%{y}</b><br>Trips: %{x:,}<extra></extra>'
+            customdata=top_clusters['neighborhood'],
+            hovertemplate='<b>%{y}</b><br>%{customdata}<br>Trips: %{x:,}<extra></extra>'
         ))
         
         fig.update_layout(
@@ -1387,7 +2468,114 @@ def update_cluster_chart(_):
             yaxis={'visible': False},
             height=250
         )
+        return Uncached(fig)
+
+@app.callback(
+    Output('zone-chart', 'figure'),
+    [Input('start-date', 'date'), Input('end-date', 'date'),
+     Input('time-filter', 'value'), Input('mode-single', 'className')]
+)
+@cached_figure('zone-chart', chart_key)
+def update_zone_chart(start, end, time_filter, single_class):
+    """Busiest taxi zones in the selected window, read off the zone cube"""
+    try:
+        single_mode = 'active' in (single_class or '')
+        window = cube_window(ZONE_CUBE, start, end, time_filter, single_mode, fields=CUBE_FIELDS) if ZONE_CUBE is not None else None
+        counts = window['count'].sum(axis=(0, 1)) if window is not None else np.zeros(1)
+        # Slot 0 holds pickups outside every zone
+        counts[0] = 0
+        
+        if counts.sum() == 0:
+            fig = go.Figure()
+            fig.update_layout(
+                template='plotly_dark',
+                paper_bgcolor='rgba(0,0,0,0)',
+                plot_bgcolor='rgba(0,0,0,0)',
+                annotations=[{
+                    'text': 'No zone data available',
+                    'xref': 'paper',
+                    'yref': 'paper',
+                    'x': 0.5,
+                    'y': 0.5,
+                    'showarrow': False,
+                    'font': {'size': 14, 'color': '#64748b'}
+                }],
+                xaxis={'visible': False},
+                yaxis={'visible': False},
+                height=250
+            )
+            return fig
+        
+        fare_sum = window['fare_sum'].sum(axis=(0, 1))
+        fare_count = window['fare_count'].sum(axis=(0, 1))
+        top = np.argsort(counts, kind='stable')[::-1][:12]
+        top = top[counts[top] > 0][::-1]
+        
+        hover = 'Trips: %{x:,}<br>Avg fare: $%{customdata[0]:.2f}'
+        details = [(fare_sum[top] / np.maximum(fare_count[top], 1)).round(2)]
+        if 'duration_sum' in window:
+            duration_min = window['duration_sum'].sum(axis=(0, 1)) / 60
+            duration_count = window['duration_count'].sum(axis=(0, 1))
+            details.append((duration_min[top] / np.maximum(duration_count[top], 1)).round(1))
+            hover += '<br>Avg trip: %{customdata[1]:.1f} min'
+        
+        fig = go.Figure()
+        fig.add_trace(go.Bar(
+            x=counts[top],
+            y=[zone_label(zone) for zone in top],
+            orientation='h',
+            marker=dict(color='#3b82f6', line=dict(width=0)),
+            text=counts[top],
+            texttemplate='%{text:,}',
+            textposition='outside',
+            customdata=np.column_stack(details),
+            hovertemplate='<b>%{y}</b><br>' + hover + '<extra></extra>'
+        ))
+        
+        fig.update_layout(
+            template='plotly_dark',
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            margin=dict(l=90, r=80, t=10, b=40),
+            xaxis=dict(
+                title='',
+                gridcolor='rgba(255,255,255,0.05)',
+                showgrid=True,
+                zeroline=False
+            ),
+            yaxis=dict(
+                title='',
+                gridcolor='rgba(0,0,0,0)',
+                showgrid=False,
+                automargin=True
+            ),
+            showlegend=False,
+            height=280,
+            bargap=0.2
+        )
+        
         return fig
+    except Exception as e:
+        print(f"Error in zone chart: {e}")
+        fig = go.Figure()
+        fig.update_layout(
+            template='plotly_dark',
+            paper_bgcolor='rgba(0,0,0,0)',
+            plot_bgcolor='rgba(0,0,0,0)',
+            annotations=[{
+                'text': 'Error loading zone chart',
+                'xref': 'paper',
+                'yref': 'paper',
+                'x': 0.5,
+                'y': 0.5,
+                'showarrow': False,
+                'font': {'size': 12, 'color': '#ef4444'}
+            }],
+            xaxis={'visible': False},
+            yaxis={'visible': False},
+            height=250
+        )
+        return Uncached(fig)
 
 if __name__ == "__main__":
     import os
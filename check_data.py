@@ -1,4 +1,5 @@
 import pandas as pd
+from pipeline import PICKUP_COLUMN, load_trips, trip_dataset
 
 # Check what columns are in your cluster metrics file
 print("=" * 60)
@@ -22,17 +23,28 @@ except Exception as e:
     print(f"❌ Error reading cluster metrics: {e}")
 
 print("\n" + "=" * 60)
-print("CHECKING MAIN TAXI DATA FILE")
+print("CHECKING PARTITIONED TRIP DATASET")
 print("=" * 60)
 
 try:
-    taxi_df = pd.read_csv('outputs/merged_cleaned_taxi_data.csv', nrows=100)
+    dataset = trip_dataset('outputs')
     print(f"\nColumns in taxi data:")
-    for col in taxi_df.columns:
-        print(f"  - {col}")
+    for field in dataset.schema:
+        print(f"  - {field.name} ({field.type})")
+    
+    # Footer metadata only: row counts and pickup-time stats per partition file
+    print(f"\nPartitions:")
+    for fragment in dataset.get_fragments():
+        metadata = fragment.metadata
+        pickup_col = metadata.schema.names.index(PICKUP_COLUMN)
+        stats = [metadata.row_group(i).column(pickup_col).statistics for i in range(metadata.num_row_groups)]
+        first = min(s.min for s in stats if s is not None and s.has_min_max)
+        last = max(s.max for s in stats if s is not None and s.has_min_max)
+        print(f"  - {fragment.path}: {metadata.num_rows:,} rows, "
+              f"{metadata.num_row_groups} row groups, {first} → {last}")
     
     print(f"\nSample row:")
-    print(taxi_df.iloc[0])
+    print(load_trips('outputs', limit=1).iloc[0])
     
 except Exception as e:
-    print(f"❌ Error reading taxi data: {e}")
\ No newline at end of file
+    print(f"❌ Error reading taxi data: {e}")
@@ -4,7 +4,9 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
+import os
 from datetime import datetime, timedelta
+from pipeline import DATASET_NAME, SAMPLE_SEED, stratified_sample, trip_months
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 app.title = "NYC Taxi Analytics"
@@ -39,11 +41,17 @@ def load_data():
     # Load taxi data from outputs folder
     try:
         print(f"\nLoading {SAMPLE_SIZE:,} taxi trips from outputs folder...")
-        taxi_df = pd.read_csv(
-            'outputs/merged_cleaned_taxi_data.csv',
-            nrows=SAMPLE_SIZE,
-            low_memory=False
-        )
+        if os.path.isdir(os.path.join('outputs', DATASET_NAME)):
+            # Partitioned Parquet written by `python pipeline.py clean`:
+            # the same number of trips from every month, not just January
+            per_month = SAMPLE_SIZE // max(len(trip_months('outputs')), 1)
+            taxi_df = stratified_sample('outputs', per_stratum=per_month, seed=SAMPLE_SEED)
+        else:
+            taxi_df = pd.read_csv(
+                'outputs/merged_cleaned_taxi_data.csv',
+                nrows=SAMPLE_SIZE,
+                low_memory=False
+            )
         
         print(f"  Columns in taxi data: {list(taxi_df.columns[:10])}...")
         
@@ -52,6 +60,9 @@ def load_data():
         elif 'pickup_datetime' in taxi_df.columns:
             taxi_df['pickup_datetime'] = pd.to_datetime(taxi_df['pickup_datetime'])
         
+        if 'pickup_datetime' in taxi_df.columns:
+            taxi_df = taxi_df.sort_values('pickup_datetime', kind='stable', ignore_index=True)
+        
         print(f"✓ Loaded {len(taxi_df):,} trips")
         
         if 'pickup_datetime' in taxi_df.columns:
@@ -72,30 +83,36 @@ def load_data():
     return metrics_df, taxi_df
 
 def detect_available_dates(df):
-    """Dynamically detect available date ranges from the data"""
+    """Dynamically detect available date ranges from the data.
+
+    One pass over the sorted pickup_datetime column: each entry also carries
+    the month's row span in df and its trips per day.
+    """
     if df is None or 'pickup_datetime' not in df.columns:
         # Fallback to default
         return [
-            {'start': datetime(2015, 1, 1).date(), 'end': datetime(2015, 1, 31).date(), 'label': 'January 2015'}
+            {'start': datetime(2015, 1, 1).date(), 'end': datetime(2015, 1, 31).date(), 'label': 'January 2015',
+             'rows': (0, 0), 'day_counts': pd.Series(dtype='int64')}
         ]
     
-    # Group by year-month
-    df['year_month'] = df['pickup_datetime'].dt.to_period('M')
-    available_periods = df['year_month'].unique()
+    # Rows are sorted by pickup_datetime in load_data, unparseable ones last
+    day = df['pickup_datetime'].to_numpy().astype('datetime64[D]')
+    day = day[~np.isnat(day)]
+    if len(day) == 0:
+        return detect_available_dates(None)
+    day_rows = np.concatenate(([0], np.flatnonzero(day[1:] != day[:-1]) + 1, [len(day)]))
+    days = day[day_rows[:-1]]
+    months = days.astype('datetime64[M]')
+    month_days = np.flatnonzero(np.r_[True, months[1:] != months[:-1], True])
     
     date_ranges = []
-    for period in sorted(available_periods):
-        period_data = df[df['year_month'] == period]
-        start_date = period_data['pickup_datetime'].min().date()
-        end_date = period_data['pickup_datetime'].max().date()
-        
-        # Format label
-        month_name = period.strftime('%B %Y')
-        
+    for lo, hi in zip(month_days[:-1], month_days[1:]):
         date_ranges.append({
-            'start': start_date,
-            'end': end_date,
-            'label': month_name
+            'start': pd.Timestamp(days[lo]).date(),
+            'end': pd.Timestamp(days[hi - 1]).date(),
+            'label': pd.Timestamp(months[lo]).strftime('%B %Y'),
+            'rows': (int(day_rows[lo]), int(day_rows[hi])),
+            'day_counts': pd.Series(np.diff(day_rows[lo:hi + 1]), index=pd.DatetimeIndex(days[lo:hi]))
         })
     
     return date_ranges
@@ -1023,39 +1040,40 @@ def update_map(start, end, time_filter, map_type, single_class):
                     # Sort by size to draw largest first (background)
                     sorted_metrics = metrics_df.sort_values(count_col, ascending=False)
                     
-                    # Normalize sizes for better visualization
-                    max_points = sorted_metrics[count_col].max()
-                    min_points = sorted_metrics[count_col].min()
+                    # Normalize sizes for better visualization (15-50 pixel range)
+                    points = sorted_metrics[count_col].to_numpy()
+                    max_points = points.max()
+                    min_points = points.min()
+                    span = max_points - min_points
+                    size_normalized = (points - min_points) / span if span else np.zeros(len(points))
+                    marker_sizes = 15 + size_normalized * 35
                     
                     # Create color palette - distinct colors for top clusters
-                    colors = ['#ef4444', '#f59e0b', '#10b981', '#3b82f6', '#8b5cf6', 
-                             '#ec4899', '#06b6d4', '#84cc16', '#f97316', '#6366f1']
+                    colors = np.array(['#ef4444', '#f59e0b', '#10b981', '#3b82f6', '#8b5cf6', 
+                                       '#ec4899', '#06b6d4', '#84cc16', '#f97316', '#6366f1'])
+                    marker_colors = colors[np.arange(len(points)) % len(colors)]
+                    
+                    hover_text = (
+                        "Cluster " + sorted_metrics.index.astype(str)
+                        + "<br>" + sorted_metrics[count_col].map('{:,}'.format) + " pickups"
+                    )
                     
-                    for idx, row in sorted_metrics.iterrows():
-                        # Calculate marker size (10-50 range based on points)
-                        size_normalized = (row[count_col] - min_points) / (max_points - min_points)
-                        marker_size = 15 + (size_normalized * 35)  # 15-50 pixel range
-                        
-                        # Get color (cycle through palette)
-                        color_idx = list(sorted_metrics.index).index(idx) % len(colors)
-                        marker_color = colors[color_idx]
-                        
-                        # Add cluster as individual trace
-                        fig.add_trace(go.Scattermapbox(
-                            lat=[row[lat_col]],
-                            lon=[row[lon_col]],
-                            mode='markers',
-                            marker=dict(
-                                size=marker_size,
-                                color=marker_color,
-                                opacity=0.7,
-                                sizemode='diameter'
-                            ),
-                            text=f"Cluster {idx}<br>{row[count_col]:,} pickups",
-                            hoverinfo='text',
-                            name=f"Cluster {idx}",
-                            showlegend=False
-                        ))
+                    # One trace for all clusters; largest come first so they
+                    # are drawn underneath the smaller ones
+                    fig.add_trace(go.Scattermapbox(
+                        lat=sorted_metrics[lat_col],
+                        lon=sorted_metrics[lon_col],
+                        mode='markers',
+                        marker=dict(
+                            size=marker_sizes,
+                            color=marker_colors,
+                            opacity=0.7,
+                            sizemode='diameter'
+                        ),
+                        text=hover_text,
+                        hoverinfo='text',
+                        showlegend=False
+                    ))
                 else:
                     # Fallback without size data
                     fig.add_trace(go.Scattermapbox(
@@ -0,0 +1,69 @@
+"""Offline reverse geocoding against the NYC TLC taxi zones."""
+import json
+import os
+import zipfile
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+# Official TLC taxi zone shapefile (NY State Plane, US feet)
+ZONES_URL = "https://d37ci6vzurychx.cloudfront.net/misc/taxi_zones.zip"
+
+
+def build_zone_file(zip_path, out_path):
+    """Convert the TLC taxi_zones.zip shapefile into a WGS84 GeoJSON file"""
+    import geopandas as gpd
+
+    with zipfile.ZipFile(zip_path) as archive:
+        shp_name = next(name for name in archive.namelist() if name.endswith(".shp"))
+    zones = gpd.read_file(f"zip://{zip_path}!{shp_name}").to_crs(epsg=4326)
+    zones = zones[["LocationID", "zone", "borough", "geometry"]]
+    # ~5 m tolerance keeps the file small without moving zone borders visibly
+    zones["geometry"] = zones.geometry.simplify(0.00005)
+
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    zones.to_file(tmp_path, driver="GeoJSON")
+    os.replace(tmp_path, out_path)
+
+
+class ZoneGeocoder:
+    """Point-in-polygon lookups over taxi zones through an STRtree"""
+
+    def __init__(self, path):
+        with open(path, encoding="utf-8") as f:
+            features = json.load(f)["features"]
+        self.geoms = np.array([shape(feature["geometry"]) for feature in features])
+        self.location_id = np.array([feature["properties"]["LocationID"] for feature in features])
+        self.zone = [feature["properties"]["zone"] for feature in features]
+        self.borough = [feature["properties"]["borough"] for feature in features]
+        self.names = {
+            int(location_id): f"{zone}, {borough}"
+            for location_id, zone, borough in zip(self.location_id, self.zone, self.borough)
+        }
+        self.tree = shapely.STRtree(self.geoms)
+
+    def lookup(self, lat, lon):
+        """(zone, borough) containing the point, or None outside every zone"""
+        hits = self.tree.query(shapely.Point(lon, lat), predicate="intersects")
+        if len(hits) == 0:
+            return None
+        i = int(hits.min())
+        return self.zone[i], self.borough[i]
+
+    def location_ids(self, lats, lons):
+        """TLC LocationID of the zone containing each point, 0 outside every zone.
+
+        Points on a shared border match several zones; like lookup(), the
+        first zone in file order wins.
+        """
+        points = shapely.points(np.asarray(lons, dtype=np.float64), np.asarray(lats, dtype=np.float64))
+        point_idx, zone_idx = self.tree.query(points, predicate="intersects")
+        order = np.lexsort((zone_idx, point_idx))
+        point_idx, zone_idx = point_idx[order], zone_idx[order]
+        first = np.ones(len(point_idx), dtype=bool)
+        first[1:] = point_idx[1:] != point_idx[:-1]
+
+        ids = np.zeros(len(points), dtype=np.uint16)
+        ids[point_idx[first]] = self.location_id[zone_idx[first]]
+        return ids
@@ -0,0 +1,576 @@
+"""Preprocessing pipeline for the raw TLC trip files.
+
+Replaces the cleaning loop in notebooks/01_preprocessing.ipynb:
+
+    python pipeline.py clean --data-dir data --output-dir outputs --workers 4
+
+Each yellow_tripdata_*.csv is cleaned in its own worker process and streamed
+chunk by chunk into a Parquet dataset partitioned by pickup year and month:
+
+    outputs/trips/year=2015/month=01/yellow_tripdata_2015-01.parquet
+
+Finished files are recorded in outputs/manifest.json, so a rerun only
+processes new or changed inputs. load_trips() reads the dataset back,
+skipping partitions and row groups outside a date range or bbox, and
+stratified_sample() draws a fixed number of trips from every month or day:
+
+    python pipeline.py sample --per-month 13000 --output outputs/merged_sample.geojson
+
+build_pyramid() ranks a seeded sample so that its first 1K, 10K, 100K and 1M
+rows are nested map tiers, each a subset of the next:
+
+    python pipeline.py pyramid --output outputs/merged_sample.geojson
+
+run_aggregate() counts every cleaned trip, fare and trip duration per
+(day, hour, taxi zone) into the small trip_aggregates.parquet the dashboard
+loads for its exact totals:
+
+    python pipeline.py aggregate --zones data_cache/taxi_zones.geojson
+"""
+import argparse
+import glob
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+DATA_DIR = "data"
+OUTPUT_DIR = "outputs"
+RAW_PATTERN = "yellow_tripdata_*.csv"
+DATASET_NAME = "trips"
+# Hive partition fields of the dataset, from the year=/month= directories
+PARTITION_COLUMNS = ["year", "month"]
+MANIFEST_NAME = "manifest.json"
+# Bump when clean_file's output changes, so the next run re-cleans every file
+CLEAN_VERSION = 2
+# Rows per read chunk, and so the largest row group written
+CHUNK_SIZE = 100_000
+
+# Stratified sample defaults: about 200K trips over the 15 months of 2015-16
+SAMPLE_PER_MONTH = 13_334
+SAMPLE_SEED = 42
+
+# Nested map sample tiers; the pyramid holds the largest one
+MAP_TIERS = (1_000, 10_000, 100_000, 1_000_000)
+
+AGGREGATE_NAME = "trip_aggregates.parquet"
+ZONES_PATH = os.path.join("data_cache", "taxi_zones.geojson")
+# Trip durations outside [0, 24h] are clock errors and left out of the sums
+MAX_TRIP_SECONDS = 24 * 3600
+
+# Same bounds as the notebook: anything outside this box is a GPS error
+LON_RANGE = (-80, -70)
+LAT_RANGE = (35, 45)
+COORD_COLUMNS = ["pickup_longitude", "pickup_latitude", "dropoff_longitude", "dropoff_latitude"]
+
+PICKUP_COLUMN = "tpep_pickup_datetime"
+DATETIME_COLUMNS = [PICKUP_COLUMN, "tpep_dropoff_datetime"]
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Fixed dtypes for the TLC columns, so every chunk maps to the same Parquet
+# schema even when a chunk happens to have no flags or only whole numbers
+RAW_DTYPES = {
+    "VendorID": "Int8",
+    "passenger_count": "Int16",
+    "RateCodeID": "Int8",
+    "store_and_fwd_flag": "string",
+    "payment_type": "Int8",
+    **{col: "float64" for col in COORD_COLUMNS},
+    **{col: "float64" for col in [
+        "trip_distance", "fare_amount", "extra", "mta_tax", "tip_amount",
+        "tolls_amount", "improvement_surcharge", "total_amount",
+    ]},
+}
+# Raw column spellings that changed between years, mapped to the RAW_DTYPES
+# name: the 2016 files say RatecodeID where 2015 says RateCodeID
+COLUMN_ALIASES = {"RatecodeID": "RateCodeID"}
+
+# ================================
+# CLEANING
+# ================================
+def clean_chunk(chunk):
+    """Drop trips with missing or out-of-range pickup/dropoff coordinates,
+    or with a pickup time that does not parse"""
+    chunk = chunk.dropna(subset=COORD_COLUMNS)
+    chunk = chunk[
+        chunk.pickup_longitude.between(*LON_RANGE) &
+        chunk.pickup_latitude.between(*LAT_RANGE) &
+        chunk.dropoff_longitude.between(*LON_RANGE) &
+        chunk.dropoff_latitude.between(*LAT_RANGE)
+    ]
+    chunk = chunk.assign(**{
+        col: pd.to_datetime(chunk[col], format=DATETIME_FORMAT, errors="coerce")
+        for col in DATETIME_COLUMNS if col in chunk.columns
+    })
+    return chunk.dropna(subset=[PICKUP_COLUMN])
+
+def partition_path(dataset_dir, year, month, name):
+    stem = os.path.splitext(name)[0]
+    return os.path.join(dataset_dir, f"year={year}", f"month={month:02d}", f"{stem}.parquet")
+
+def clean_file(source_path, dataset_dir, chunk_size=CHUNK_SIZE):
+    """Clean one raw file into the dataset, one chunk in memory at a time.
+
+    Rows go to the partition of their own pickup month, so the odd trip
+    filed under the wrong monthly file still lands in the right place. Each
+    chunk is sorted by pickup time and written as its own row group, with
+    min/max statistics on every column. Partition files are written to temp
+    files and renamed once complete, so an interrupted run never leaves a
+    partial output behind.
+    """
+    name = os.path.basename(source_path)
+    dtypes = {col: dtype for col, dtype in RAW_DTYPES.items() if col not in DATETIME_COLUMNS}
+    dtypes.update({alias: dtypes[col] for alias, col in COLUMN_ALIASES.items()})
+    writers = {}
+    schema = None
+    rows_in = rows_out = 0
+    try:
+        for chunk in pd.read_csv(source_path, chunksize=chunk_size, dtype=dtypes, low_memory=False):
+            rows_in += len(chunk)
+            # One column name per field, so every file writes the same schema
+            chunk = chunk.rename(columns=COLUMN_ALIASES)
+            cleaned = clean_chunk(chunk).sort_values(PICKUP_COLUMN, kind="stable")
+            pickup = cleaned[PICKUP_COLUMN]
+            for (year, month), part in cleaned.groupby([pickup.dt.year, pickup.dt.month]):
+                table = pa.Table.from_pandas(part, schema=schema, preserve_index=False)
+                schema = table.schema
+                if (year, month) not in writers:
+                    path = partition_path(dataset_dir, year, month, name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    writers[(year, month)] = (pq.ParquetWriter(tmp_path, schema), tmp_path, path)
+                writers[(year, month)][0].write_table(table, row_group_size=chunk_size)
+            rows_out += len(cleaned)
+
+        for writer, tmp_path, path in writers.values():
+            writer.close()
+            os.replace(tmp_path, path)
+    finally:
+        for writer, tmp_path, path in writers.values():
+            if os.path.exists(tmp_path):
+                writer.close()
+                os.remove(tmp_path)
+
+    outputs = sorted(os.path.relpath(path, dataset_dir) for _, _, path in writers.values())
+    return {"rows_in": rows_in, "rows_out": rows_out, "outputs": outputs}
+
+# ================================
+# MANIFEST
+# ================================
+def source_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def is_done(manifest, name, source_path, dataset_dir):
+    """True if name was cleaned from this exact source by this CLEAN_VERSION
+    and its outputs exist"""
+    entry = manifest.get(name)
+    return (
+        entry is not None
+        and entry.get("version") == CLEAN_VERSION
+        and {key: entry.get(key) for key in ("size", "mtime")} == source_signature(source_path)
+        and all(os.path.exists(os.path.join(dataset_dir, path)) for path in entry.get("outputs", []))
+    )
+
+# ================================
+# RUNNER
+# ================================
+def run_clean(data_dir=DATA_DIR, output_dir=OUTPUT_DIR, workers=None, force=False,
+              chunk_size=CHUNK_SIZE):
+    """Clean every raw monthly file not already in the manifest"""
+    dataset_dir = os.path.join(output_dir, DATASET_NAME)
+    os.makedirs(dataset_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+
+    jobs = {}
+    for source_path in sorted(glob.glob(os.path.join(data_dir, RAW_PATTERN))):
+        name = os.path.basename(source_path)
+        if not force and is_done(manifest, name, source_path, dataset_dir):
+            print(f"✓ Skipping {name} (already cleaned)")
+            continue
+        jobs[name] = source_path
+
+    if not jobs:
+        print("✓ Nothing to clean")
+        return manifest
+
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    print(f"Cleaning {len(jobs)} file(s) with {workers} worker(s)...")
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(clean_file, source_path, dataset_dir, chunk_size): name
+            for name, source_path in jobs.items()
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            source_path = jobs[name]
+            try:
+                stats = future.result()
+            except Exception as e:
+                print(f"❌ Failed cleaning {name}: {e}")
+                failed.append(name)
+                continue
+            # Partitions a previous run of this source wrote but this one did not
+            stale = set(manifest.get(name, {}).get("outputs", [])) - set(stats["outputs"])
+            for path in stale:
+                if os.path.exists(os.path.join(dataset_dir, path)):
+                    os.remove(os.path.join(dataset_dir, path))
+            # Only this process writes the manifest, after each finished file
+            manifest[name] = {**source_signature(source_path), "version": CLEAN_VERSION, **stats}
+            save_manifest(manifest, manifest_path)
+            print(f"✓ {name}: {stats['rows_out']:,} of {stats['rows_in']:,} rows kept")
+
+    if failed:
+        raise SystemExit(f"❌ {len(failed)} file(s) failed: {', '.join(sorted(failed))}")
+    return manifest
+
+# ================================
+# LOADING
+# ================================
+def trip_filter(start_date=None, end_date=None, bbox=None):
+    """Dataset filter for pickups in [start_date, end_date] and inside the
+    (south, west, north, east) bbox; None matches everything.
+
+    The year/month terms let pyarrow skip whole partitions, the pickup time
+    and coordinate terms skip row groups through their min/max statistics.
+    """
+    year, month, pickup = ds.field("year"), ds.field("month"), ds.field(PICKUP_COLUMN)
+    terms = []
+    if start_date:
+        start = pd.Timestamp(start_date).normalize()
+        terms.append((year > start.year) | ((year == start.year) & (month >= start.month)))
+        terms.append(pickup >= start.to_pydatetime())
+    if end_date:
+        end = pd.Timestamp(end_date).normalize()
+        terms.append((year < end.year) | ((year == end.year) & (month <= end.month)))
+        terms.append(pickup < (end + pd.Timedelta(days=1)).to_pydatetime())
+    if bbox is not None:
+        south, west, north, east = bbox
+        terms.append(ds.field("pickup_latitude") >= south)
+        terms.append(ds.field("pickup_latitude") <= north)
+        terms.append(ds.field("pickup_longitude") >= west)
+        terms.append(ds.field("pickup_longitude") <= east)
+
+    expression = None
+    for term in terms:
+        expression = term if expression is None else expression & term
+    return expression
+
+def trip_dataset(output_dir=OUTPUT_DIR):
+    return ds.dataset(os.path.join(output_dir, DATASET_NAME), format="parquet", partitioning="hive")
+
+def trip_columns(dataset, columns=None):
+    """columns, or by default every trip column without the year/month
+    partition fields, which only exist to filter on"""
+    if columns is not None:
+        return columns
+    return [name for name in dataset.schema.names if name not in PARTITION_COLUMNS]
+
+def load_trips(output_dir=OUTPUT_DIR, start_date=None, end_date=None, bbox=None,
+               columns=None, limit=None):
+    """Cleaned trips from the partitioned dataset as a DataFrame.
+
+    Only partitions and row groups that can hold matching pickups are read;
+    limit stops reading after that many matching rows, in partition order.
+    """
+    dataset = trip_dataset(output_dir)
+    expression = trip_filter(start_date, end_date, bbox)
+    columns = trip_columns(dataset, columns)
+    if limit is not None:
+        table = dataset.head(limit, columns=columns, filter=expression)
+    else:
+        table = dataset.to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+def partition_files(output_dir=OUTPUT_DIR):
+    """((year, month), path) of every file in the dataset, from its path"""
+    for path in trip_dataset(output_dir).files:
+        match = re.search(r"year=(\d+)[/\\]month=(\d+)", path)
+        if match:
+            yield (int(match.group(1)), int(match.group(2))), path
+
+def partition_months(output_dir=OUTPUT_DIR):
+    """(year, month) of every partition in the dataset"""
+    return sorted({month for month, _ in partition_files(output_dir)})
+
+def trip_months(output_dir=OUTPUT_DIR):
+    """(year, month) of every month a raw source file covers.
+
+    clean_file files stray pickups, like a 2014-12-31 trip in the 2015-01
+    file, under their own month. A partition holding only such strays has
+    no file named for its month and is left out, so the odd stray never
+    counts as a month of data. Files without a YYYY-MM name always count.
+    """
+    months = set()
+    for month, path in partition_files(output_dir):
+        named = re.search(r"(\d{4})-(\d{2})", os.path.basename(path))
+        if named is None or (int(named.group(1)), int(named.group(2))) == month:
+            months.add(month)
+    return sorted(months)
+
+def month_filter(months):
+    """Dataset filter for the given (year, month) partitions"""
+    return (ds.field("year") * 100 + ds.field("month")).isin([year * 100 + month for year, month in months])
+
+# ================================
+# SAMPLING
+# ================================
+def seeded_hash(df, seed):
+    """uint64 hash of each row's values, mixed with the seed.
+
+    hash_pandas_object only applies its hash_key to string columns, so the
+    seed is folded into the row hashes and the result hashed again.
+    """
+    row_hash = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    seed_hash = pd.util.hash_array(np.array([seed], dtype=np.uint64))[0]
+    return pd.util.hash_array(row_hash ^ seed_hash)
+
+def stratified_sample(output_dir=OUTPUT_DIR, per_stratum=SAMPLE_PER_MONTH, by="month",
+                      seed=SAMPLE_SEED, columns=None, start_date=None, end_date=None, bbox=None,
+                      keep_key=False):
+    """Up to per_stratum trips from every pickup month (or day), in one pass.
+
+    Each row gets a key from a seeded hash of its values and every stratum
+    keeps its per_stratum smallest keys. That is a uniform sample without
+    replacement of the stratum, the same for a given seed whatever order the
+    batches arrive in, and memory stays at per_stratum rows per stratum plus
+    one record batch. keep_key leaves the hash in a _key column. Only the
+    months in trip_months() are read, so stray pickups never form a stratum.
+    """
+    unit = {"month": "datetime64[M]", "day": "datetime64[D]"}[by]
+    if columns is not None and PICKUP_COLUMN not in columns:
+        columns = [PICKUP_COLUMN] + list(columns)
+    kept = {}
+    dataset = trip_dataset(output_dir)
+    columns = trip_columns(dataset, columns)
+    expression = month_filter(trip_months(output_dir))
+    window = trip_filter(start_date, end_date, bbox)
+    if window is not None:
+        expression = expression & window
+    for batch in dataset.to_batches(columns=columns, filter=expression):
+        if batch.num_rows == 0:
+            continue
+        df = batch.to_pandas()
+        df["_key"] = seeded_hash(df, seed)
+        strata = df[PICKUP_COLUMN].to_numpy().astype(unit)
+        for stratum, part in df.groupby(strata, sort=False):
+            current = kept.get(stratum)
+            if current is not None:
+                if len(current) == per_stratum:
+                    part = part[part["_key"] < current["_key"].iloc[-1]]
+                    if part.empty:
+                        continue
+                part = pd.concat([current, part])
+            kept[stratum] = part.nsmallest(per_stratum, "_key")
+
+    if not kept:
+        return dataset.schema.empty_table().select(columns).to_pandas()
+    sample = pd.concat([kept[stratum] for stratum in sorted(kept)], ignore_index=True)
+    if not keep_key:
+        sample = sample.drop(columns="_key")
+    sample = sample.sort_values(PICKUP_COLUMN, kind="stable", ignore_index=True)
+    print(f"✓ Sampled {len(sample):,} trips from {len(kept)} {by}s (seed={seed})")
+    return sample
+
+def build_pyramid(output_dir=OUTPUT_DIR, tiers=MAP_TIERS, seed=SAMPLE_SEED):
+    """Month-stratified sample of max(tiers) trips, ordered by map_rank.
+
+    Ranks follow the sampler's seeded hash, so the rows with map_rank below
+    any tier size are a uniform sample of that size and every tier is a
+    subset of the next. Rows are stored in rank order, so each tier is also
+    a prefix of the file.
+    """
+    per_month = -(-max(tiers) // max(len(trip_months(output_dir)), 1))
+    sample = stratified_sample(output_dir, per_month, seed=seed, keep_key=True)
+    sample = sample.sort_values("_key", kind="stable", ignore_index=True).head(max(tiers))
+    sample = sample.drop(columns="_key")
+    sample["map_rank"] = np.arange(len(sample), dtype=np.uint32)
+    sizes = ", ".join(f"{min(tier, len(sample)):,}" for tier in tiers)
+    print(f"✓ Map pyramid: {len(sample):,} trips, tiers of {sizes}")
+    return sample
+
+def write_sample(sample, output_path):
+    """Save a sample as GeoJSON (like the notebook) or Parquet, by extension"""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if output_path.endswith(".parquet"):
+        sample.to_parquet(output_path, index=False)
+    else:
+        import geopandas as gpd
+
+        # Timestamps in the TLC text layout, which is what the dashboard parses
+        sample = sample.assign(**{
+            col: sample[col].dt.strftime(DATETIME_FORMAT)
+            for col in DATETIME_COLUMNS if col in sample.columns
+        })
+        gdf = gpd.GeoDataFrame(
+            sample,
+            geometry=gpd.points_from_xy(sample.pickup_longitude, sample.pickup_latitude),
+            crs="EPSG:4326",
+        )
+        gdf.to_file(output_path, driver="GeoJSON")
+    print(f"✓ Saved sample: {output_path}")
+
+# ================================
+# AGGREGATION
+# ================================
+def aggregate_month(output_dir, year, month, zones_path):
+    """Exact trips, fare sums and duration sums per (day, hour, zone) of one
+    month partition, as a long table of its non-empty cells.
+
+    Streams the partition batch by batch into dense month-sized bincounts,
+    so memory does not grow with the number of trips.
+    """
+    from geocoder import ZoneGeocoder
+
+    geocoder = ZoneGeocoder(zones_path)
+    n_zones = int(geocoder.location_id.max()) + 1
+    month_start = pd.Timestamp(year=year, month=month, day=1)
+    first_day = int(month_start.timestamp()) // 86400
+    size = month_start.days_in_month * 24 * n_zones
+
+    sums = {name: np.zeros(size) for name in ["trips", "fare_sum", "fare_count", "duration_sum", "duration_count"]}
+    dataset = trip_dataset(output_dir)
+    columns = [col for col in DATETIME_COLUMNS + ["pickup_latitude", "pickup_longitude", "total_amount"]
+               if col in dataset.schema.names]
+    partition = (ds.field("year") == year) & (ds.field("month") == month)
+    for batch in dataset.to_batches(columns=columns, filter=partition):
+        if batch.num_rows == 0:
+            continue
+        df = batch.to_pandas()
+        pickup = df[PICKUP_COLUMN].to_numpy().astype("datetime64[s]").astype(np.int64)
+        zone = geocoder.location_ids(df["pickup_latitude"], df["pickup_longitude"])
+        cell = ((pickup // 86400 - first_day) * 24 + pickup // 3600 % 24) * n_zones + zone
+        sums["trips"] += np.bincount(cell, minlength=size)
+
+        if "total_amount" in df.columns:
+            fare = df["total_amount"].to_numpy(dtype=np.float64)
+            valid = ~np.isnan(fare)
+            sums["fare_sum"] += np.bincount(cell[valid], weights=fare[valid], minlength=size)
+            sums["fare_count"] += np.bincount(cell[valid], minlength=size)
+
+        if "tpep_dropoff_datetime" in df.columns:
+            dropoff = df["tpep_dropoff_datetime"].to_numpy().astype("datetime64[s]")
+            duration = (dropoff.astype(np.int64) - pickup).astype(np.float64)
+            valid = ~np.isnat(dropoff) & (duration >= 0) & (duration <= MAX_TRIP_SECONDS)
+            sums["duration_sum"] += np.bincount(cell[valid], weights=duration[valid], minlength=size)
+            sums["duration_count"] += np.bincount(cell[valid], minlength=size)
+
+    cells = np.flatnonzero(sums["trips"])
+    day_hour, zone = np.divmod(cells, n_zones)
+    day, hour = np.divmod(day_hour, 24)
+    return pd.DataFrame({
+        "day": (day + first_day).astype(np.uint16),
+        "hour": hour.astype(np.uint8),
+        "zone": zone.astype(np.uint16),
+        "trips": sums["trips"][cells].astype(np.int64),
+        "fare_sum": sums["fare_sum"][cells],
+        "fare_count": sums["fare_count"][cells].astype(np.int64),
+        "duration_sum": sums["duration_sum"][cells],
+        "duration_count": sums["duration_count"][cells].astype(np.int64),
+    })
+
+def run_aggregate(output_dir=OUTPUT_DIR, zones_path=ZONES_PATH, workers=None, output_path=None):
+    """Aggregate every month partition in a process pool into one file.
+
+    Partitions holding only stray pickups are aggregated too, so the totals
+    count every cleaned trip.
+    """
+    output_path = output_path or os.path.join(output_dir, AGGREGATE_NAME)
+    months = partition_months(output_dir)
+    if not months:
+        raise SystemExit(f"❌ No cleaned trips under {os.path.join(output_dir, DATASET_NAME)}")
+
+    workers = min(workers or os.cpu_count() or 1, len(months))
+    print(f"Aggregating {len(months)} month(s) with {workers} worker(s)...")
+    tables = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(aggregate_month, output_dir, year, month, zones_path): (year, month)
+            for year, month in months
+        }
+        for future in as_completed(futures):
+            year, month = futures[future]
+            table = future.result()
+            tables.append(table)
+            print(f"✓ {year}-{month:02d}: {int(table['trips'].sum()):,} trips in {len(table):,} cells")
+
+    # Months never overlap, so the per-month tables just stack
+    aggregates = pd.concat(tables, ignore_index=True).sort_values(["day", "hour", "zone"], ignore_index=True)
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    aggregates.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, output_path)
+    print(f"✓ Saved {output_path}: {int(aggregates['trips'].sum()):,} trips, "
+          f"{os.path.getsize(output_path) / 1e6:.1f} MB")
+    return aggregates
+
+# ================================
+# CLI
+# ================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    clean = commands.add_parser("clean", help="clean raw yellow_tripdata_*.csv files")
+    clean.add_argument("--data-dir", default=DATA_DIR)
+    clean.add_argument("--output-dir", default=OUTPUT_DIR)
+    clean.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    clean.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    clean.add_argument("--force", action="store_true", help="reclean files already in the manifest")
+
+    sample = commands.add_parser("sample", help="seeded sample of every month (or day) of cleaned trips")
+    sample.add_argument("--output-dir", default=OUTPUT_DIR)
+    budget = sample.add_mutually_exclusive_group()
+    budget.add_argument("--per-month", type=int, default=SAMPLE_PER_MONTH)
+    budget.add_argument("--per-day", type=int, default=None)
+    sample.add_argument("--seed", type=int, default=SAMPLE_SEED)
+    sample.add_argument("--output", default=os.path.join(OUTPUT_DIR, "merged_sample.geojson"),
+                        help=".geojson or .parquet")
+
+    pyramid = commands.add_parser("pyramid", help="nested, seeded map sample tiers in one file")
+    pyramid.add_argument("--output-dir", default=OUTPUT_DIR)
+    pyramid.add_argument("--seed", type=int, default=SAMPLE_SEED)
+    pyramid.add_argument("--output", default=os.path.join(OUTPUT_DIR, "merged_sample.geojson"),
+                         help=".geojson or .parquet")
+
+    aggregate = commands.add_parser("aggregate", help="exact per-(day, hour, zone) totals over all cleaned trips")
+    aggregate.add_argument("--output-dir", default=OUTPUT_DIR)
+    aggregate.add_argument("--zones", default=ZONES_PATH, help="taxi_zones.geojson written by the dashboard")
+    aggregate.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    aggregate.add_argument("--output", default=None, help=f"default: <output-dir>/{AGGREGATE_NAME}")
+
+    args = parser.parse_args(argv)
+    if args.command == "clean":
+        run_clean(args.data_dir, args.output_dir, args.workers, args.force, args.chunk_size)
+    elif args.command == "sample":
+        if args.per_day is not None:
+            trips = stratified_sample(args.output_dir, args.per_day, by="day", seed=args.seed)
+        else:
+            trips = stratified_sample(args.output_dir, args.per_month, by="month", seed=args.seed)
+        write_sample(trips, args.output)
+    elif args.command == "pyramid":
+        write_sample(build_pyramid(args.output_dir, seed=args.seed), args.output)
+    elif args.command == "aggregate":
+        run_aggregate(args.output_dir, args.zones, args.workers, args.output)
+
+if __name__ == "__main__":
+    main()